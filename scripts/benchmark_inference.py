@@ -0,0 +1,80 @@
+import argparse
+import pathlib
+import sys
+import time
+from threading import Thread
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from daq.InferenceServer import InferenceServer, physical_cores
+from daq.VisionDelegate import VisionDelegate
+from utils.cv_utils import CameraFrame
+from utils.instrumentation import LatencyHistogram
+
+# Compares VisionDelegates with an interpreter each, splitting the cores between them,
+# against the same clients sharing an InferenceServer. Every client detects frames back
+# to back for the duration, like the vision thread of one camera.
+
+def run_clients(delegates, frames, duration):
+    histograms = [LatencyHistogram() for _ in delegates]
+
+    def client(delegate, histogram):
+        i = 0
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            start = time.perf_counter_ns()
+            delegate.run_detection(frames[i % len(frames)])
+            histogram.record(time.perf_counter_ns() - start)
+            i += 1
+
+    threads = [Thread(target=client, args=(d, h)) for d, h in zip(delegates, histograms)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    merged = LatencyHistogram()
+    for histogram in histograms:
+        merged.counts += histogram.counts
+        merged.count += histogram.count
+        merged.total_ns += histogram.total_ns
+        merged.max_ns = max(merged.max_ns, histogram.max_ns)
+    return merged
+
+def report(mode, histogram, duration, cores):
+    stats = histogram.summary()
+    print(f"{mode:<10}{stats['count'] / duration:>10.1f} frames/s{stats['count'] / duration / cores:>8.1f} per core"
+          f"  p50 {stats['p50'] * 1e3:.1f}ms p99 {stats['p99'] * 1e3:.1f}ms max {stats['max'] * 1e3:.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-m',
+        '--model',
+        default=str(pathlib.Path(__file__).parent.parent.absolute() / "models" / "model3.tflite")
+    )
+    parser.add_argument(
+        '-c',
+        '--clients',
+        type=int,
+        default=4,
+        help='number of cameras detecting at once'
+    )
+    parser.add_argument(
+        '-d',
+        '--duration',
+        type=float,
+        default=10.0
+    )
+    args = parser.parse_args()
+    cores = physical_cores()
+    rng = np.random.default_rng(0)
+    frames = [CameraFrame.from_rgb(rng.integers(0, 256, (144, 256, 3), dtype=np.uint8)) for _ in range(8)]
+
+    threads = max(cores // args.clients, 1)
+    delegates = [VisionDelegate(args.model, threads, 0.5) for _ in range(args.clients)]
+    report("dedicated", run_clients(delegates, frames, args.duration), args.duration, cores)
+
+    server = InferenceServer(args.model, 0.5, cores)
+    delegates = [VisionDelegate(args.model, threshold=0.5, server=server) for _ in range(args.clients)]
+    report("server", run_clients(delegates, frames, args.duration), args.duration, cores)
+    server.stop()
@@ -0,0 +1,93 @@
+import argparse
+import pathlib
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from drivers.LaneDetection import LaneDetection
+from drivers.LaneDetectionProcess import LaneDetectionProcess
+from managers.AngularOccupancy import AngularOccupancy
+from utils.RerunableThread import RerunableThread
+
+# Compares lane detection on a RerunableThread with LaneDetectionProcess while the loop
+# thread keeps the occupancy busy, like the lidar half of a tick does.
+# Frames come from a sensor log (main.py --record) or from the images in test-images.
+
+class _SteeringController:
+    steering = 0
+
+    def set_steering(self, angle):
+        self.steering = angle
+
+def load_frames(source):
+    if source.endswith(".dbsl"):
+        from sim.SensorLog import SensorLogReader
+        log = SensorLogReader(source)
+        return [cv2.cvtColor(log[i].image, cv2.COLOR_BGR2RGB) for i in range(len(log))]
+    paths = sorted(pathlib.Path(source).glob("*.png")) + sorted(pathlib.Path(source).glob("*.jpg"))
+    # lane detection takes RGB frames, like the camera hands them out
+    return [cv2.cvtColor(cv2.resize(cv2.imread(str(p)), (256, 144)), cv2.COLOR_BGR2RGB) for p in paths]
+
+def synthetic_blobs(rng, count=40):
+    blobs = []
+    for angle in rng.uniform(-np.pi, np.pi, count):
+        r = rng.uniform(5, 40)
+        spread = np.linspace(angle - 0.02, angle + 0.02, 10)
+        blobs.append(np.stack((r * np.sin(spread), r * np.cos(spread)), axis=-1))
+    return blobs
+
+def run(mode, frames, ticks):
+    laneDetection = LaneDetection(None)
+    laneDetection.steeringController = _SteeringController()
+    if mode == "process":
+        worker = LaneDetectionProcess(laneDetection)
+    else:
+        worker = RerunableThread(laneDetection.follow_lane, "follow_lane")
+    angularOccupancy = AngularOccupancy()
+    rng = np.random.default_rng(0)
+
+    # let the worker start before measuring
+    worker.run((frames[0], 0.0))
+    while worker.is_running:
+        time.sleep(0.001)
+
+    submitted = 0
+    tick_times = np.zeros(ticks)
+    start = time.perf_counter()
+    for tick in range(ticks):
+        tick_start = time.perf_counter()
+        if not worker.is_running:
+            worker.run((frames[tick % len(frames)], 5.0))
+            submitted += 1
+        angularOccupancy.occupant_from_blobs(synthetic_blobs(rng))
+        angularOccupancy.decay()
+        angularOccupancy.expire_occupants()
+        tick_times[tick] = time.perf_counter() - tick_start
+    elapsed = time.perf_counter() - start
+    if mode == "process":
+        worker.close()
+
+    tick_times *= 1e3
+    print(f"{mode:<8} tick mean {tick_times.mean():.3f}ms p95 {np.percentile(tick_times, 95):.3f}ms, "
+          f"{submitted / elapsed:.1f} lane frames/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-f',
+        '--frames',
+        default=str(pathlib.Path(__file__).parent.parent.absolute() / "test-images"),
+        help='a sensor log or a directory of images'
+    )
+    parser.add_argument(
+        '-t',
+        '--ticks',
+        type=int,
+        default=500
+    )
+    args = parser.parse_args()
+    frames = load_frames(args.frames)
+    for mode in ("thread", "process"):
+        run(mode, frames, args.ticks)
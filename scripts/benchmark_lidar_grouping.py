@@ -0,0 +1,68 @@
+import argparse
+import pathlib
+import sys
+import time
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from utils.lidar_utils import DISTANCE_THRESHOLD, MIN_POINTS_IN_GROUP, distance_of_point, groupContiguousPoints
+
+# the per-point implementation groupContiguousPoints replaced, kept here as the baseline
+def legacy_group_contiguous_points(point_cloud):
+    groups = []
+    group = [point_cloud[0]]
+    for point in point_cloud[1:]:
+        dis = distance_of_point(point, group[-1])
+        if dis <= DISTANCE_THRESHOLD:
+            group.append(point)
+        else:
+            if len(group) >= MIN_POINTS_IN_GROUP:
+                groups.append(group)
+            group = [point]
+    return groups
+
+def synthetic_cloud(num_points, rng):
+    # a sweep of objects around the car with gaps between them
+    angles = np.sort(rng.uniform(-np.pi, np.pi, num_points))
+    ranges = np.repeat(rng.uniform(5, 60, num_points // 20 + 1), 20)[:num_points]
+    ranges += rng.normal(0, 0.05, num_points)
+    return np.stack((ranges * np.cos(angles), ranges * np.sin(angles)), axis=-1).astype(np.float32)
+
+def time_call(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-s',
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[1000, 10000, 100000]
+    )
+    parser.add_argument(
+        '-r',
+        '--repeat',
+        type=int,
+        default=3
+    )
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    for size in args.sizes:
+        cloud = synthetic_cloud(size, rng)
+        legacy = legacy_group_contiguous_points(cloud)
+        vectorized = groupContiguousPoints(cloud)
+        assert len(legacy) == len(vectorized)
+        for a, b in zip(legacy, vectorized):
+            assert np.array_equal(np.array(a), b)
+
+        legacy_time = time_call(legacy_group_contiguous_points, cloud, args.repeat)
+        vectorized_time = time_call(groupContiguousPoints, cloud, args.repeat)
+        print(f"{size} points, {len(vectorized)} groups: legacy {legacy_time * 1e3:.2f}ms, "
+              f"vectorized {vectorized_time * 1e3:.3f}ms ({legacy_time / vectorized_time:.0f}x)")
@@ -0,0 +1,96 @@
+import argparse
+import pathlib
+import sys
+import time
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from daq.LidarDelegate import LidarDelegate
+from drivers.CollisionWatchdog import CollisionWatchdog
+from drivers.DrivingArbiter import DrivingArbiter
+from drivers.LaneDetection import LaneDetection
+from managers.AngularOccupancy import AngularOccupancy
+from sim.SensorLog import ReplayCarClient
+from utils.cv_utils import get_frame
+
+# Runs the perception stack of Main.main over a recorded sensor log (main.py --record)
+# and reports the time spent in every stage. Lane following runs inline instead of on
+# its own thread so its cost shows up in the tick it belongs to.
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+
+    def time(self, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def report(self):
+        # the tick cut short by the end of the log is left out
+        ticks = min(len(t) for t in self.timings.values())
+        total = np.sum([t[:ticks] for t in self.timings.values()], axis=0)
+        print(f"{'stage':<16}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}  (ms)")
+        for stage, timings in list(self.timings.items()) + [('tick', total)]:
+            t = np.array(timings[:ticks]) * 1e3
+            print(f"{stage:<16}{t.mean():>10.3f}{np.median(t):>10.3f}{np.percentile(t, 95):>10.3f}{t.max():>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log')
+    parser.add_argument(
+        '-m',
+        '--model',
+        default=None,
+        help='also run object detection with this tflite model'
+    )
+    parser.add_argument(
+        '--neat',
+        action='store_true',
+        help='weigh occupants with the NEAT model, run from the directory holding winner.pkl'
+    )
+    parser.add_argument(
+        '--ttc',
+        action='store_true',
+        help='weigh occupants by time to collision'
+    )
+    args = parser.parse_args()
+
+    carClient = ReplayCarClient(args.log)
+    drivingArbiter = DrivingArbiter(carClient)
+    visionDelegate = None
+    if args.model is not None:
+        from daq.VisionDelegate import VisionDelegate
+        visionDelegate = VisionDelegate(args.model)
+    laneDetection = LaneDetection(drivingArbiter)
+    angularOccupancy = AngularOccupancy(visionDelegate=visionDelegate)
+    lidarDriver = LidarDelegate(angularOccupancy)
+    collisionWatchdog = CollisionWatchdog(drivingArbiter, angularOccupancy)
+    laneDetection.start()
+    weigh_batch = None
+    if args.neat:
+        from NEATModel import neat_weigh_batch as weigh_batch
+    elif args.ttc:
+        from utils.threat_utils import ttc_weigh_batch as weigh_batch
+
+    timer = StageTimer()
+    try:
+        while True:
+            timer.time('sendBatch', drivingArbiter.sendBatch)
+            img = timer.time('get_image', get_frame, carClient)
+            lidarData = timer.time('getLidarData', carClient.getLidarData, 'MyLidar1')
+            currentSpeed = timer.time('getCarState', carClient.getCarState).speed
+            if visionDelegate is not None:
+                timer.time('run_detection', visionDelegate.run_detection, img)
+            timer.time('checkLidar', lidarDriver.checkLidar, lidarData)
+            if weigh_batch is not None:
+                timer.time('reweigh', angularOccupancy.reweigh, weigh_batch)
+            timer.time('runLoop', collisionWatchdog.runLoop, currentSpeed)
+            timer.time('follow_lane', laneDetection.follow_lane, img.rgb, currentSpeed)
+            timer.time('decay', angularOccupancy.decay)
+            timer.time('expire', angularOccupancy.expire_occupants)
+    except EOFError:
+        pass
+
+    print(f"{carClient.frame_index + 1} frames from {args.log}")
+    timer.report()
@@ -0,0 +1,167 @@
+import argparse
+import pathlib
+import sys
+import time
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from drivers.CollisionWatchdog import ACTIVATION_WEIGHT, FRONT_ANGLE, CollisionStrategy, CollisionWatchdog
+from drivers.Driver import DriverPriority
+from managers.AngularOccupancy import DISCRETIZATION_AMOUNT, AngularOccupancy
+
+# Times CollisionWatchdog against the per-slot loops it used to run, at several
+# occupant counts, and checks that both make the same decisions on every scene.
+
+class _Controller:
+    throttle = 0
+    brake = 0
+    steering = 0
+
+    def set_steering(self, angle):
+        self.steering = angle
+
+# records the requests instead of arbitrating them
+class _Arbiter:
+    def __init__(self):
+        self.requests = []
+
+    def requestSpeedControl(self, driver, priority):
+        self.requests.append(("speed", priority))
+
+    def requestSteeringControl(self, driver, priority):
+        self.requests.append(("steering", priority))
+
+    def giveUpSpeedControl(self, driver):
+        self.requests.append(("speed", None))
+
+    def giveUpSteeringControl(self, driver):
+        self.requests.append(("steering", None))
+
+class LoopWatchdog(CollisionWatchdog):
+    def runLoop(self, currentSpeed: float):
+        if self._collisionStrategy == CollisionStrategy.braking:
+            self.avoidViaBraking()
+            return
+        elif self._collisionStrategy == CollisionStrategy.left:
+            self.swerveLeft(currentSpeed)
+        elif self._collisionStrategy == CollisionStrategy.right:
+            self.swerveRight(currentSpeed)
+
+        for i, occptr in enumerate(self._angularOccupancy.occupancy_list):
+            if occptr == 0:
+                continue
+            occ = self._angularOccupancy.occupant_reference[occptr]
+            if occ.weight < ACTIVATION_WEIGHT:
+                continue
+            angle = (i / DISCRETIZATION_AMOUNT) * np.pi * 2
+            if (abs(angle) < FRONT_ANGLE) and occ.center_point[0] > 0:
+                self._collisionStrategy = CollisionStrategy.braking
+                self._drivingArbiter.requestSpeedControl(self, DriverPriority.High)
+                return
+            elif angle < (np.pi) and self._collisionStrategy != CollisionStrategy.right:
+                self._collisionStrategy = CollisionStrategy.right
+                self._drivingArbiter.requestSteeringControl(self, DriverPriority.High)
+                self._drivingArbiter.requestSpeedControl(self, DriverPriority.Medium)
+                return
+            elif angle > (np.pi) and self._collisionStrategy != CollisionStrategy.left:
+                self._collisionStrategy = CollisionStrategy.left
+                self._drivingArbiter.requestSteeringControl(self, DriverPriority.High)
+                self._drivingArbiter.requestSpeedControl(self, DriverPriority.Medium)
+                return
+
+    def swerve(self, currentSpeed, dir):
+        if currentSpeed > 8:
+            self._speedController.throttle = 0
+            self._speedController.brake = 3
+        else:
+            self._speedController.throttle = 1
+            self._speedController.brake = 0
+        rightFree = True
+        for i in range(0, dir * DISCRETIZATION_AMOUNT // 2):
+            occptr = self._angularOccupancy.occupancy_list[i]
+            if occptr != 0:
+                occ = self._angularOccupancy.occupant_reference[occptr]
+                if occ.distance <= 30:
+                    self._swerveCount = self._swerveCount + dir
+                    self._steeringController.set_steering(dir * np.pi / 8)
+                    rightFree = False
+                    break
+                else:
+                    self._steeringController.set_steering(dir * np.pi / 32)
+        if rightFree:
+            self._safeContinueCount += 1
+            if self._safeContinueCount >= 5:
+                self._swerveCount = self._swerveCount - dir
+                self._steeringController.set_steering(-dir * np.pi / 8)
+                if self._swerveCount >= 0:
+                    self._swerveCount = 0
+                    self._safeContinueCount = 0
+                    self._drivingArbiter.giveUpSteeringControl(self)
+                    self._drivingArbiter.giveUpSpeedControl(self)
+        else:
+            self._safeContinueCount = 0
+
+    def avoidViaBraking(self):
+        self._speedController.throttle = 0
+        self._speedController.brake = 100
+        index = round((FRONT_ANGLE / (2 * np.pi)) * DISCRETIZATION_AMOUNT)
+        safe_to_continue = True
+        for i in range(-index, index + 1):
+            occptr = self._angularOccupancy.occupancy_list[i]
+            if occptr != 0:
+                occ = self._angularOccupancy.occupant_reference[occptr]
+                safe_to_continue = safe_to_continue and (occ.distance > 30) and (occ.weight < ACTIVATION_WEIGHT)
+        if safe_to_continue:
+            if self._safeContinueCount >= 25:
+                self._drivingArbiter.giveUpSpeedControl(self)
+                self._safeContinueCount = 0
+            self._safeContinueCount = self._safeContinueCount + 1
+        else:
+            self._safeContinueCount = 0
+
+# occupancy with count occupants spread over random slots, few of them threatening
+def scene(rng, count) -> AngularOccupancy:
+    angularOccupancy = AngularOccupancy()
+    for _ in range(count):
+        center_point = rng.uniform(-50, 50, 2)
+        occ_id = angularOccupancy._add_occupant(center_point)
+        angularOccupancy.occupants.weight[occ_id] = rng.choice((0.0, 20.0), p=(0.98, 0.02))
+    slots = rng.random(DISCRETIZATION_AMOUNT) < min(count / DISCRETIZATION_AMOUNT, 0.5)
+    angularOccupancy.occupancy_list[slots] = rng.integers(1, count + 1, slots.sum())
+    return angularOccupancy
+
+def decide(watchdog_type, angularOccupancy, strategy, speed):
+    watchdog = watchdog_type(_Arbiter(), angularOccupancy)
+    watchdog._speedController = _Controller()
+    watchdog._steeringController = _Controller()
+    watchdog._collisionStrategy = strategy
+    start = time.perf_counter()
+    watchdog.runLoop(speed)
+    watchdog.elapsed = time.perf_counter() - start
+    return watchdog
+
+def state(watchdog):
+    return (watchdog._collisionStrategy, watchdog._safeContinueCount, watchdog._swerveCount, watchdog._drivingArbiter.requests,
+            watchdog._speedController.throttle, watchdog._speedController.brake, watchdog._steeringController.steering)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-s',
+        '--scenes',
+        type=int,
+        default=200
+    )
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    strategies = list(CollisionStrategy)
+    print(f"{'occupants':>10}{'loop':>12}{'vectorized':>12}  (us per runLoop)")
+    for count in (10, 100, 1000):
+        scenes = [(scene(rng, count), strategies[i % len(strategies)], rng.uniform(0, 12)) for i in range(args.scenes)]
+        timings = {}
+        for watchdog_type in (LoopWatchdog, CollisionWatchdog):
+            elapsed = [decide(watchdog_type, *s).elapsed for s in scenes]
+            timings[watchdog_type] = np.mean(elapsed) * 1e6
+        for angularOccupancy, strategy, speed in scenes:
+            assert state(decide(LoopWatchdog, angularOccupancy, strategy, speed)) == state(decide(CollisionWatchdog, angularOccupancy, strategy, speed))
+        print(f"{count:>10}{timings[LoopWatchdog]:>12.1f}{timings[CollisionWatchdog]:>12.1f}")
@@ -4,9 +4,12 @@ import matplotlib.patches as patches
 from PIL import Image, ImageOps
 import numpy as np
 import label_image
-import cv2
-import tflite_runtime.interpreter as tflite
 import argparse
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from utils.cv_utils import ObjectDetector, get_frame
 
 client = CarClient()
 client.confirmConnection()
@@ -18,13 +21,6 @@ plt.ion()
 plt.show()
 
 
-def get_image():
-    image_response = client.simGetImages([ImageRequest(0, ImageType.Scene, False, False)])[0]
-    arr = np.frombuffer(image_response.image_data_uint8, dtype=np.uint8)
-    image_bgr = arr.reshape(image_response.height, image_response.width, 3)
-    image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-    return image_rgb
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -45,19 +41,16 @@ if __name__ == "__main__":
         default=0.7
     )
     args = parser.parse_args()
-    interpreter = tflite.Interpreter(model_path=args.model, num_threads=args.numthreads)
-    interpreter.allocate_tensors()
-
-    input_shape = interpreter.get_input_details()[0]['shape']
-    height = input_shape[1]
-    width = input_shape[2]
+    detector = ObjectDetector.from_model(args.model, args.numthreads, args.threshold)
+    height = detector.height
+    width = detector.width
 
     while (True):
         plt.cla()
-        img = Image.fromarray(get_image()).resize((width, height))
-        input_data = np.expand_dims(img, axis=0)
+        frame = get_frame(client)
+        img = frame.resized(width, height)
 
-        results = label_image.detect_objects(interpreter, input_data, args.threshold)
+        results = detector.detect_frame(frame)
         print(list(map(lambda r: label_image.class_names[r["class_id"]], results)))
 
         ax.patches = []
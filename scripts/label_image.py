@@ -1,14 +1,18 @@
 from PIL import Image
 from PIL import ImageFilter
 from PIL.ImageFilter import Filter
-import tflite_runtime.interpreter as tflite
 import argparse
+import pathlib
+import sys
 import time
 import numpy as np
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from utils.cv_utils import ObjectDetector
+
 colors = [
     'red',
     'green',
@@ -23,44 +27,14 @@ class_names = [
     'sign'
 ]
 
-def set_input(interpreter, input_data, input_mean=127.5, input_std=127.5):
-    input_details = interpreter.get_input_details()[0]
-    if input_details['dtype'] == np.float32:
-        input_data = (np.float32(input_data) - input_mean) / input_std
-
-    tensor_index = input_details['index']
-    interpreter.set_tensor(tensor_index, input_data)
-
-def get_output(interpreter, index):
-    tensor_index = interpreter.get_output_details()[index]['index']
-    output_data = interpreter.get_tensor(tensor_index)
-    return np.squeeze(output_data)
-
-def detect_objects(interpreter, image, threshold, time_exec=False):
-    set_input(interpreter, image)
+def detect_objects(detector: ObjectDetector, image, time_exec=False):
+    detector.set_input(image)
     if time_exec:
         start_time = time.time()
-    interpreter.invoke()
+    results = detector.detect()
     if time_exec:
         end_time = time.time()
         print(f"Model ran in {end_time - start_time}s")
-
-    boxes = get_output(interpreter, 0)
-    classes = get_output(interpreter, 1)
-    scores = get_output(interpreter, 2)
-    count = int(get_output(interpreter, 3))
-    results = []
-    for i in range(count):
-        # print(f"Detected a {class_names[int(classes[i])]} with confidence {scores[i]}")
-        if scores[i] >= threshold:
-            result = {
-                'bounding_box': boxes[i],
-                'class_id': int(classes[i]),
-                'score': scores[i]
-            }
-            results.append(result)
-
-
     return results
 
 if __name__ ==  '__main__':
@@ -83,18 +57,14 @@ if __name__ ==  '__main__':
     )
 
     args = parser.parse_args()
-    interpreter = tflite.Interpreter(model_path=args.model, num_threads=64)
-    interpreter.allocate_tensors()
-
-    input_shape = interpreter.get_input_details()[0]['shape']
+    detector = ObjectDetector.from_model(args.model, 64, float(args.threshold))
 
-    height = input_shape[1]
-    width = input_shape[2]
+    height = detector.height
+    width = detector.width
 
     img = Image.open(args.image).convert('RGB').resize((width, height))
-    input_data = np.expand_dims(img, axis=0)
 
-    results = detect_objects(interpreter, input_data, float(args.threshold), time_exec=True)
+    results = detect_objects(detector, np.asarray(img), time_exec=True)
 
     fig, ax = plt.subplots()
     for res in results:
@@ -3,17 +3,35 @@ from airsim.client import CarClient
 import numpy
 
 from daq.LidarDelegate import LidarDelegate
+from daq.SensorPrefetcher import SensorPrefetcher
 from daq.VisionDelegate import VisionDelegate
 from drivers.CollisionWatchdog import CollisionWatchdog
 from drivers.DrivingArbiter import DrivingArbiter
 from drivers.LaneDetection import LaneDetection
 from managers.AngularOccupancy import AngularOccupancy
-from utils.cv_utils import get_image
+from utils.clock import Clock, wall_clock
+from utils.cv_utils import get_frame
+from utils.instrumentation import Instrumentation, disabled
+from utils.scheduler import RateScheduler
 
 import argparse
 
+# rates in Hz of the subsystems of the loop
+CONTROL_RATE = 50
+LANE_RATE = 20
+VISION_RATE = 10
+TELEMETRY_RATE = 5
+DRAW_RATE = 5
+
 class Main:
-    def __init__(self, carClient: CarClient, collisionWatchdog: CollisionWatchdog, drivingArbiter: DrivingArbiter, angularOccupancy: AngularOccupancy, visionDelegate: VisionDelegate):
+    # weighBatch maps the occupant feature matrix to occupant weights, see OccupantTable.reweigh
+    # instrumentation times every stage of the tick, it is off unless one is passed in
+    # with sensors, the camera, lidar and car state are prefetched instead of read from carClient
+    # Every main() call is one control tick, paced by the caller. Lane following, vision,
+    # telemetry and drawing run at their own rates on clock, and vision, telemetry and
+    # drawing are shed when the tick has already used up its 1 / CONTROL_RATE budget, but
+    # still run once every MAX_SHED_PERIODS + 1 of their periods when every tick overruns.
+    def __init__(self, carClient: CarClient, collisionWatchdog: CollisionWatchdog, drivingArbiter: DrivingArbiter, angularOccupancy: AngularOccupancy, visionDelegate: VisionDelegate, weighBatch = None, instrumentation: Instrumentation = disabled, sensors: SensorPrefetcher = None, clock: Clock = wall_clock):
         parser = argparse.ArgumentParser()
         parser.add_argument(
             "--debug_cv",
@@ -25,7 +43,8 @@ class Main:
             type=bool,
             default=False
         )
-        self.args = parser.parse_args()
+        # other arguments belong to the entry point that created this loop
+        self.args, _ = parser.parse_known_args()
         self.carClient = carClient
         self.carClient.confirmConnection()
         self.carClient.enableApiControl(True)
@@ -33,26 +52,68 @@ class Main:
         self.visionDelegate = visionDelegate
         self.laneDetection = LaneDetection(self.drivingArbiter)
         self.laneDetection.start()
-        self.loopCount = 0
 
         self.angularOccupancy = angularOccupancy
         self.lidarDriver = LidarDelegate(self.angularOccupancy)
         self.collisionWatchdog = collisionWatchdog
+        self.weighBatch = weighBatch
+        self.instrumentation = instrumentation
+        self.sensors = sensors
+        self._clock = clock
+        self._img = None
+        self._currentSpeed = 0
 
-    def main(self):
-        self.drivingArbiter.sendBatch()
-        img = get_image(self.carClient)
-        lidarData = self.carClient.getLidarData('MyLidar1')
-        currentSpeed = self.carClient.getCarState().speed
-        self.lidarDriver.checkLidar(lidarData)
-        self.collisionWatchdog.runLoop(currentSpeed)
-        self.laneDetection.follow_lane(img, currentSpeed)
-        self.angularOccupancy.decay()
-        self.angularOccupancy.sendobj()
-        self.angularOccupancy.expire_occupants()
-        self.angularOccupancy.categorize(img)
-        if self.loopCount == 0 and self.args.debug_cv:
-            self.visionDelegate.draw()
+        self.scheduler = RateScheduler(clock, instrumentation)
+        self.scheduler.every('follow_lane', LANE_RATE, self.followLane)
+        self.scheduler.every('categorize', VISION_RATE, self.categorize, sheddable=True)
+        self.scheduler.every('sendobj', TELEMETRY_RATE, self.angularOccupancy.sendobj, sheddable=True)
+        if self.args.debug_cv:
+            self.scheduler.every('draw_cv', DRAW_RATE, self.visionDelegate.draw, sheddable=True)
         if self.args.debug_ao:
-            self.angularOccupancy.draw()
-        self.loopCount = (self.loopCount + 1) % 5
+            self.scheduler.every('draw_ao', DRAW_RATE, self.angularOccupancy.draw, sheddable=True)
+
+    def sense(self):
+        stage = self.instrumentation.stage
+        if self.sensors is not None:
+            with stage('acquire'):
+                sensorTick = self.sensors.next()
+            self._img, lidarData, self._currentSpeed = sensorTick.image, sensorTick.lidar_data, sensorTick.car_state.speed
+        else:
+            with stage('get_image'):
+                self._img = get_frame(self.carClient)
+            with stage('getLidarData'):
+                lidarData = self.carClient.getLidarData('MyLidar1')
+            with stage('getCarState'):
+                self._currentSpeed = self.carClient.getCarState().speed
+        return lidarData
+
+    # the collision path, run every tick
+    def control(self):
+        stage = self.instrumentation.stage
+        with stage('sendBatch'):
+            self.drivingArbiter.sendBatch()
+        lidarData = self.sense()
+        with stage('checkLidar'):
+            self.lidarDriver.checkLidar(lidarData)
+        if self.weighBatch is not None:
+            with stage('reweigh'):
+                self.angularOccupancy.reweigh(self.weighBatch)
+        with stage('runLoop'):
+            self.collisionWatchdog.runLoop(self._currentSpeed)
+        with stage('decay'):
+            self.angularOccupancy.decay()
+        with stage('expire'):
+            self.angularOccupancy.expire_occupants()
+
+    def followLane(self):
+        self.laneDetection.follow_lane(self._img.rgb, self._currentSpeed)
+
+    def categorize(self):
+        self.angularOccupancy.categorize(self._img)
+
+    def main(self):
+        with self.instrumentation.stage('tick'):
+            deadline = self._clock.time_ns() + round(1e9 / CONTROL_RATE)
+            self.control()
+            self.scheduler.run_pending(deadline)
+        self.instrumentation.tick()
@@ -1,5 +1,6 @@
 import pickle
 import neat
+from utils.neat_utils import BatchFeedForwardNetwork
 
 config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
                             neat.DefaultSpeciesSet, neat.DefaultStagnation,
@@ -8,6 +9,11 @@ with open("./winner.pkl", "rb") as f:
     genome = pickle.load(f)
 
 net = neat.nn.FeedForwardNetwork.create(genome, config)
+batch_net = BatchFeedForwardNetwork.create(net)
 def neat_weigh(occ):
     out = net.activate((occ.center_angle, occ.center_point[0], occ.center_point[1], occ.distance, occ.relative_velocity[0], occ.relative_velocity[1], occ.relative_speed))
-    return out[0]
\ No newline at end of file
+    return out[0]
+
+# weighs every row of an OccupantTable feature matrix in one call
+def neat_weigh_batch(features):
+    return batch_net.activate(features)[:, 0]
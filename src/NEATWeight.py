@@ -1,11 +1,18 @@
-from time import time
+import argparse
+import multiprocessing
+from time import perf_counter, sleep
+from typing import List, Union
 from airsim.client import CarClient
 import neat
 from MainClass import Main
+from daq.InferenceServer import InferenceClient, InferenceServer, InferenceService
 from daq.VisionDelegate import VisionDelegate
 from drivers.CollisionWatchdog import CollisionStrategy, CollisionWatchdog
 from drivers.DrivingArbiter import DrivingArbiter
 from managers.AngularOccupancy import DISCRETIZATION_AMOUNT, AngularOccupancy
+from sim.KinematicCarClient import KinematicCarClient
+from utils.clock import Clock, SimulatedClock, wall_clock
+from utils.neat_utils import BatchFeedForwardNetwork
 import pickle
 import paho.mqtt.client as mqtt
 
@@ -23,89 +30,202 @@ except:
 IDLE_THRESHOLD = 5
 IDLE_SPEED = 1
 GOAL_Y = -48
+
+# An endpoint is either "host:port" of an AirSim server or "kinematic:<path>" for a
+# KinematicCarClient built from a recorded lidar sweep saved with numpy.save
+def car_client_for_endpoint(endpoint: str = None, clock: Clock = wall_clock):
+    if endpoint is None:
+        return CarClient()
+    if endpoint.startswith("kinematic:"):
+        return KinematicCarClient.from_file(endpoint[len("kinematic:"):], clock)
+    host, port = endpoint.rsplit(":", 1)
+    return CarClient(ip=host, port=int(port))
+
+# With a step, the simulator is paused and advanced by step seconds per tick while the
+# trainer's SimulatedClock follows it, so genomes run as fast as the loop allows.
 class NeatTrainer:
-    def __init__(self):
-        self.carClient = CarClient()
+    def __init__(self, carClient = None, mqttClient = client, visionThreads = 16, clock: Clock = wall_clock, step: float = None, inferenceServer: Union[InferenceServer, InferenceClient] = None):
+        self.carClient = carClient if carClient is not None else CarClient()
+        self._mqttClient = mqttClient
+        self._visionThreads = visionThreads
+        self._inferenceServer = inferenceServer
+        self._clock = clock
+        self._step = step
+        self._net = None
         self.createAll()
     def createAll(self):
         self.drivingArbiter = DrivingArbiter(self.carClient)
-        self.visionDelegate = VisionDelegate('./models/model3.tflite', 16, 0.7)
-        self.angularOccupancy = AngularOccupancy(client=client, visionDelegate=self.visionDelegate)
+        self.visionDelegate = VisionDelegate('./models/model3.tflite', self._visionThreads, 0.7, server=self._inferenceServer)
+        self.angularOccupancy = AngularOccupancy(client=self._mqttClient, visionDelegate=self.visionDelegate, clock=self._clock)
         self.collisionWatchdog = CollisionWatchdog(self.drivingArbiter, self.angularOccupancy)
-        self.mainLooper = Main(self.carClient, self.collisionWatchdog, self.drivingArbiter, self.angularOccupancy, self.visionDelegate)
+        self.mainLooper = Main(self.carClient, self.collisionWatchdog, self.drivingArbiter, self.angularOccupancy, self.visionDelegate, weighBatch=self.weighBatch, clock=self._clock)
+
+    # weighs the occupants with the genome currently being evaluated
+    def weighBatch(self, features):
+        return self._net.activate(features)[:, 0]
 
     def initData(self):
         self._startPos = self.carClient.simGetVehiclePose().position
 
+    def advanceSimulation(self):
+        if self._step is None:
+            return
+        self.carClient.simContinueForTime(self._step)
+        while not self.carClient.simIsPause():
+            sleep(0)
+        self._clock.advance(self._step)
+
+    def eval_genome(self, genome, config) -> float:
+        self.carClient.reset()
+        self.drivingArbiter.sync()
+        self.collisionWatchdog._collisionStrategy = CollisionStrategy.none
+        self.drivingArbiter.giveUpSpeedControl(self.collisionWatchdog)
+        self.drivingArbiter.giveUpSteeringControl(self.collisionWatchdog)
+        if self._step is not None:
+            self.carClient.simPause(True)
+        self.initData()
+        fitness = 100.0
+        self._net = BatchFeedForwardNetwork.create(neat.nn.FeedForwardNetwork.create(genome, config))
+
+        last_loop_time = self._clock.time()
+        collision_avoidance_time = 0.0
+        idle_time = 0.0
+        # measured on the wall clock even when stepping, to time the loop itself
+        start_time = perf_counter()
+        loop_iterations = 0
+        while True:
+            loop_iterations += 1
+            self.advanceSimulation()
+            collision = self.carClient.simGetCollisionInfo()
+            state = self.carClient.getCarState()
+            delta_time = self._clock.time() - last_loop_time
+            if state.speed <= IDLE_SPEED:
+                idle_time += delta_time
+            else:
+                idle_time = 0
+            
+            if idle_time >= IDLE_THRESHOLD:
+                print("Idle exiting")
+                break
+
+            if collision.has_collided:
+                fitness /= 5
+                print("Collision exiting")
+                break
+
+            if self.collisionWatchdog._collisionStrategy != CollisionStrategy.none:
+                collision_avoidance_time += delta_time
+            
+            last_loop_time = self._clock.time()
+            self.mainLooper.main()
+        print(f"Loop execution time {(perf_counter() - start_time) / loop_iterations}s")
+        endPos = self.carClient.simGetVehiclePose().position
+        off_goal = GOAL_Y - endPos.y_val
+        return fitness - ((off_goal) ** 2 + (collision_avoidance_time))
+
     def eval_genomes(self, genomes, config):
         for id, genome in genomes:
             print(f"Running genome {id}")
-            self.carClient.reset()
-            self.collisionWatchdog._collisionStrategy = CollisionStrategy.none
-            self.drivingArbiter.giveUpSpeedControl(self.collisionWatchdog)
-            self.drivingArbiter.giveUpSteeringControl(self.collisionWatchdog)
-            self.initData()
-            genome.fitness = 100.0
-            net = neat.nn.FeedForwardNetwork.create(genome, config)
-
-            last_loop_time = time()
-            collision_avoidance_time = 0.0
-            idle_time = 0.0
-            start_time = time()
-            loop_iterations = 0
-            while True:
-                loop_iterations += 1
-                collision = self.carClient.simGetCollisionInfo()
-                state = self.carClient.getCarState()
-                delta_time = time() - last_loop_time
-                if state.speed <= IDLE_SPEED:
-                    idle_time += delta_time
-                else:
-                    idle_time = 0
-                
-                if idle_time >= IDLE_THRESHOLD:
-                    print("Idle exiting")
-                    break
-
-                if collision.has_collided:
-                    genome.fitness /= 5
-                    print("Collision exiting")
-                    break
-
-                if self.collisionWatchdog._collisionStrategy != CollisionStrategy.none:
-                    collision_avoidance_time += delta_time
-                
-                for key in self.angularOccupancy.occupant_reference:
-                    occ = self.angularOccupancy.occupant_reference[key]
-                    out = net.activate((occ.center_angle, occ.center_point[0], occ.center_point[1], occ.distance, occ.relative_velocity[0], occ.relative_velocity[1], occ.relative_speed))
-                    occ.set_weight(out[0])
-                last_loop_time = time()
-                self.mainLooper.main()
-            print(f"Loop execution time {(time() - start_time) / loop_iterations}s")
-            endPos = self.carClient.simGetVehiclePose().position
-            off_goal = GOAL_Y - endPos.y_val
-            genome.fitness -= (off_goal) ** 2 + (collision_avoidance_time)
-
-                
+            genome.fitness = self.eval_genome(genome, config)
+
     def run(self, config_file):
-        config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
-                            neat.DefaultSpeciesSet, neat.DefaultStagnation,
-                            config_file)
-        # p = neat.Population(config)
-        p = neat.Checkpointer.restore_checkpoint('./neat-checkpoint-25')
-        p.add_reporter(neat.StdOutReporter(True))
-        stats = neat.StatisticsReporter()
-        p.add_reporter(stats)
-        p.add_reporter(neat.Checkpointer(5))
-
-        w = p.run(self.eval_genomes, 100)
-
-        print('\nBest genome:\n{!s}'.format(w))
-        
-        with open("winner.pkl", "wb") as f:
-            pickle.dump(w, f)
+        run_population(config_file, self.eval_genomes)
+
+def run_population(config_file, eval_genomes):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                        neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                        config_file)
+    # p = neat.Population(config)
+    p = neat.Checkpointer.restore_checkpoint('./neat-checkpoint-25')
+    p.add_reporter(neat.StdOutReporter(True))
+    stats = neat.StatisticsReporter()
+    p.add_reporter(stats)
+    p.add_reporter(neat.Checkpointer(5))
+
+    w = p.run(eval_genomes, 100)
+
+    print('\nBest genome:\n{!s}'.format(w))
+    
+    with open("winner.pkl", "wb") as f:
+        pickle.dump(w, f)
+
+# each pool worker owns a trainer driving its own simulator endpoint
+_worker_trainer: NeatTrainer = None
+
+def _create_trainer(endpoint: str = None, step: float = None, **kwargs) -> NeatTrainer:
+    clock = wall_clock if step is None else SimulatedClock()
+    return NeatTrainer(car_client_for_endpoint(endpoint, clock), clock=clock, step=step, **kwargs)
+
+# with inference clients, the worker detects on the evaluator's shared InferenceService
+def _init_worker(endpoints: multiprocessing.Queue, step: float, inferenceClients: List[InferenceClient]):
+    global _worker_trainer
+    endpoint, slot = endpoints.get()
+    inferenceServer = inferenceClients[slot] if inferenceClients is not None else None
+    _worker_trainer = _create_trainer(endpoint, step, mqttClient=None, visionThreads=1, inferenceServer=inferenceServer)
+
+def _eval_genome_in_worker(genome, config):
+    return _worker_trainer.eval_genome(genome, config)
+
+# Evaluates a generation across a process pool, one worker per endpoint.
+# Workers run the same NeatTrainer.eval_genome as the serial path. With interpreters, the
+# workers share one InferenceServer with that many interpreters instead of each running
+# its own interpreter.
+class ParallelGenomeEvaluator:
+    def __init__(self, endpoints: List[str], step: float = None, interpreters: int = None):
+        queue = multiprocessing.Queue()
+        for slot, endpoint in enumerate(endpoints):
+            queue.put((endpoint, slot))
+        self._inferenceService = None
+        if interpreters is not None:
+            self._inferenceService = InferenceService(InferenceServer('./models/model3.tflite', 0.7, interpreters), len(endpoints))
+        clients = self._inferenceService.clients if self._inferenceService is not None else None
+        self._pool = multiprocessing.Pool(len(endpoints), _init_worker, (queue, step, clients))
+
+    def eval_genomes(self, genomes, config):
+        jobs = [self._pool.apply_async(_eval_genome_in_worker, (genome, config)) for _, genome in genomes]
+        for (id, genome), job in zip(genomes, jobs):
+            genome.fitness = job.get()
+            print(f"Genome {id} fitness {genome.fitness}")
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        if self._inferenceService is not None:
+            self._inferenceService.stop()
 
 if __name__ == "__main__":
-    nw = NeatTrainer()
-    nw.run("./neat-config")
-    
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-e',
+        '--endpoints',
+        nargs='+',
+        default=None,
+        help='host:port or kinematic:<lidar.npy> per worker, genomes are evaluated in parallel across them'
+    )
+    parser.add_argument(
+        '-s',
+        '--step',
+        type=float,
+        default=None,
+        help='lock-step the simulator by this many seconds per tick instead of running in real time'
+    )
+    parser.add_argument(
+        '-i',
+        '--interpreters',
+        type=int,
+        default=None,
+        help='with several endpoints, share one inference server with this many interpreters between the workers'
+    )
+    args, _ = parser.parse_known_args()
+    if args.interpreters is not None and (args.endpoints is None or len(args.endpoints) == 1):
+        parser.error("--interpreters needs more than one endpoint")
+    if args.endpoints is None:
+        nw = _create_trainer(step=args.step)
+        nw.run("./neat-config")
+    elif len(args.endpoints) == 1:
+        nw = _create_trainer(args.endpoints[0], args.step)
+        nw.run("./neat-config")
+    else:
+        evaluator = ParallelGenomeEvaluator(args.endpoints, args.step, args.interpreters)
+        run_population("./neat-config", evaluator.eval_genomes)
+        evaluator.close()
@@ -0,0 +1,172 @@
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+from functools import partial
+from threading import Condition, Thread
+from typing import Dict, List, NamedTuple
+import numpy as np
+from utils.cv_utils import CameraFrame, ObjectDetector
+from utils.instrumentation import Instrumentation, disabled
+
+def physical_cores() -> int:
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return cores
+    except ImportError:
+        pass
+    try:
+        with open("/proc/cpuinfo") as f:
+            cores = set()
+            physical_id = None
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    cores.add((physical_id, value.strip()))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 1
+
+class DetectionResult(NamedTuple):
+    detections: np.ndarray
+    # seconds spent waiting for an interpreter and running it
+    queued: float
+    inference: float
+
+class _Request:
+    __slots__ = ("frame", "future", "submitted_ns")
+
+    def __init__(self, frame: CameraFrame):
+        self.frame = frame
+        self.future = Future()
+        self.submitted_ns = time.perf_counter_ns()
+
+# Serves object detection for several VisionDelegates, e.g. one per camera or per car,
+# from a pool of interpreters sized to the physical cores. Each interpreter runs single
+# threaded on its own worker thread, which scales better than one interpreter with many
+# threads since invoke() releases the GIL.
+# Every client has at most one frame waiting: a newer frame replaces the waiting one and
+# its future is cancelled, so a slow pool drops stale frames instead of queueing them and
+# latency stays bounded. Clients are served in the order their frames arrived.
+# Queue and inference times are recorded as the "inference.wait" and "inference" stages.
+class InferenceServer:
+    def __init__(self, model_path, threshold, num_interpreters = None, instrumentation: Instrumentation = disabled):
+        if num_interpreters is None:
+            num_interpreters = physical_cores()
+        self._instrumentation = instrumentation
+        self._condition = Condition()
+        self._pending: Dict[object, _Request] = OrderedDict()
+        self._stopped = False
+        self.detectors: List[ObjectDetector] = [ObjectDetector.from_model(model_path, 1, threshold) for _ in range(num_interpreters)]
+        self.height = self.detectors[0].height
+        self.width = self.detectors[0].width
+        self._workers = [Thread(target=self._serve, args=(detector,), name=f"inference-{i}", daemon=True) for i, detector in enumerate(self.detectors)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, client, frame: CameraFrame) -> Future:
+        request = _Request(frame)
+        with self._condition:
+            replaced = self._pending.pop(client, None)
+            if replaced is not None:
+                replaced.future.cancel()
+            self._pending[client] = request
+            self._condition.notify()
+        return request.future
+
+    def detect(self, client, frame: CameraFrame) -> DetectionResult:
+        return self.submit(client, frame).result()
+
+    def _serve(self, detector: ObjectDetector):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                _, request = self._pending.popitem(last=False)
+
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            start = time.perf_counter_ns()
+            try:
+                detections = detector.detect_frame(request.frame)
+            except BaseException as e:
+                request.future.set_exception(e)
+                continue
+            end = time.perf_counter_ns()
+            request.future.set_result(DetectionResult(detections, (start - request.submitted_ns) / 1e9, (end - start) / 1e9))
+            if self._instrumentation.enabled:
+                self._instrumentation.record("inference.wait", start - request.submitted_ns)
+                self._instrumentation.record("inference", end - start)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            for request in self._pending.values():
+                request.future.cancel()
+            self._pending.clear()
+            self._condition.notify_all()
+
+# Detects frames on an InferenceServer in another process, with the same detect() as the
+# server. Frames go to the InferenceService over a queue shared by every client and results
+# come back on a queue of this client's own, so a client has at most one frame in flight,
+# like the single vision thread of a VisionDelegate.
+class InferenceClient:
+    def __init__(self, requests: multiprocessing.Queue, responses: multiprocessing.Queue, slot, height, width):
+        self._requests = requests
+        self._responses = responses
+        self._slot = slot
+        self.height = height
+        self.width = width
+
+    def detect(self, client, frame: CameraFrame) -> DetectionResult:
+        self._requests.put((self._slot, frame.bgr, frame.timestamp))
+        result = self._responses.get()
+        if result is None:
+            raise CancelledError()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+# Shares one InferenceServer between processes, e.g. the pool workers of the trainer, so
+# the workers keep every interpreter of the pool busy instead of each running their own.
+# Create it before the processes and hand every process one of the num_clients clients.
+class InferenceService:
+    def __init__(self, server: InferenceServer, num_clients):
+        self._server = server
+        self._requests = multiprocessing.Queue()
+        self._responses = [multiprocessing.Queue() for _ in range(num_clients)]
+        self.clients = [InferenceClient(self._requests, responses, slot, server.height, server.width) for slot, responses in enumerate(self._responses)]
+        self._dispatcher = Thread(target=self._dispatch, name="inference-service", daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            slot, bgr, timestamp = request
+            self._server.submit(slot, CameraFrame(bgr, timestamp)).add_done_callback(partial(self._respond, slot))
+
+    def _respond(self, slot, future: Future):
+        if future.cancelled():
+            self._responses[slot].put(None)
+        elif future.exception() is not None:
+            self._responses[slot].put(future.exception())
+        else:
+            self._responses[slot].put(future.result())
+
+    # stops the server once no client is waiting on a frame
+    def stop(self):
+        self._requests.put(None)
+        self._dispatcher.join()
+        self._server.stop()
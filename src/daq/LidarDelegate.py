@@ -4,10 +4,12 @@ from time import sleep, time
 from airsim.types import GeoPoint, LidarData
 import numpy
 from managers.AngularOccupancy import AngularOccupancy
-from utils.lidar_utils import distance_of_point, parse_lidar_data, groupContiguousPoints
+from utils.lidar_utils import azimuth_of_points, distance_of_point, parse_lidar_data, groupContiguousPoints
 
 HUMAN_STOP_DISTANCE = 15
 SIDE_REGION = 3
+# points closer together than this (in meters) are treated as duplicates
+GRID_RESOLUTION = 0.05
 def isInFront(point):
     return abs(point[1]) <= SIDE_REGION and point[0] >= 0
 
@@ -32,8 +34,18 @@ class LidarDelegate:
 
     @staticmethod
     def flatten(data: numpy.array):
+        # drop height, deduplicate on a grid and order the points by azimuth so that
+        # contiguous groups follow the sweep around the car, like the angular occupancy
         flattened = data[:, :2]
-        return numpy.unique(flattened, axis=0)
+        cells = numpy.rint(flattened / GRID_RESOLUTION).astype(numpy.int64)
+        angles = azimuth_of_points(cells)
+        ranges = numpy.square(cells).sum(axis=-1)
+        # duplicates share an azimuth and a range, so they end up next to each other
+        order = numpy.lexsort((ranges, angles))
+        cells = cells[order]
+        unique = numpy.ones(len(order), dtype=bool)
+        unique[1:] = numpy.any(cells[1:] != cells[:-1], axis=-1)
+        return flattened[order[unique]]
 
     def checkLidar(self, lidarData: LidarData):
         points = parse_lidar_data(lidarData)
@@ -0,0 +1,90 @@
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Callable, Dict, NamedTuple
+from airsim.client import CarClient
+from airsim.types import CarState, LidarData
+from utils.clock import Clock, wall_clock
+from utils.cv_utils import CameraFrame, get_frame
+
+class SensorTick(NamedTuple):
+    sequence: int
+    image: CameraFrame
+    lidar_data: LidarData
+    car_state: CarState
+    # clock time each reading was received, in ns
+    timestamps: Dict[str, int]
+
+    # age of the oldest reading in seconds
+    def age(self, clock: Clock = wall_clock) -> float:
+        return (clock.time_ns() - min(self.timestamps.values())) / 1e9
+
+# Failure of a stream, raised again on the loop thread by next()
+class _StreamError(NamedTuple):
+    error: BaseException
+
+# Fetches the camera frame, lidar sweep and car state of the next tick while the current
+# one is processed. Every stream runs on its own thread with its own client connection,
+# since the RPC client cannot be shared between threads, and hands readings over through
+# a single slot buffer. A new reading replaces the one waiting, so a tick costs
+# max(I/O, compute) instead of their sum and next() gets the newest complete reading of
+# every stream, at most one fetch old. The controls stay on the loop's own client.
+class SensorPrefetcher:
+    def __init__(self, client_factory: Callable[[], CarClient], lidar_name = 'MyLidar1', clock: Clock = wall_clock):
+        self._clock = clock
+        self._stopped = Event()
+        self._sequence = 0
+        fetchers = {
+            'image': get_frame,
+            'lidar': lambda client: client.getLidarData(lidar_name),
+            'state': lambda client: client.getCarState(),
+        }
+        self._buffers: Dict[str, Queue] = {name: Queue(maxsize=1) for name in fetchers}
+        self._threads = [
+            Thread(target=self._stream, args=(client_factory(), fetch, self._buffers[name]), name=f"prefetch-{name}", daemon=True)
+            for name, fetch in fetchers.items()
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _stream(self, client, fetch, buffer: Queue):
+        while not self._stopped.is_set():
+            try:
+                reading = (fetch(client), self._clock.time_ns())
+            except BaseException as e:
+                self._replace(buffer, _StreamError(e))
+                return
+            self._replace(buffer, reading)
+
+    # latest wins: drops the reading next() has not taken yet, the stream is the only producer
+    @staticmethod
+    def _replace(buffer: Queue, reading):
+        while True:
+            try:
+                buffer.put_nowait(reading)
+                return
+            except Full:
+                try:
+                    buffer.get_nowait()
+                except Empty:
+                    pass
+
+    # blocks until every stream has a reading for the next tick
+    def next(self) -> SensorTick:
+        readings = {}
+        for name, buffer in self._buffers.items():
+            reading = buffer.get()
+            if isinstance(reading, _StreamError):
+                raise reading.error
+            readings[name] = reading
+        self._sequence += 1
+        return SensorTick(
+            sequence=self._sequence,
+            image=readings['image'][0],
+            lidar_data=readings['lidar'][0],
+            car_state=readings['state'][0],
+            timestamps={name: timestamp for name, (_, timestamp) in readings.items()},
+        )
+
+    # streams finish the fetch they are in and exit
+    def stop(self):
+        self._stopped.set()
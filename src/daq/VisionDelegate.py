@@ -1,33 +1,38 @@
+from concurrent.futures import CancelledError
 from math import pi
 from threading import Lock
-from typing import Dict, List
-import tflite_runtime.interpreter as tflite
-from utils.cv_utils import detect_objects
-from PIL import Image
+from typing import Tuple, Union
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
-from utils.cv_utils import colors
+from daq.InferenceServer import DetectionResult, InferenceClient, InferenceServer
+from utils.cv_utils import DETECTION_DTYPE, CameraFrame, ObjectDetector, colors
 
 CP_THRESHOLD = pi / 12
+# detections with the horizontal angle of their center, relative to straight ahead
+VISION_DETECTION_DTYPE = np.dtype(DETECTION_DTYPE.descr + [('h_center', np.float64)])
+
+# With an InferenceServer, or an InferenceClient of one in another process, frames are
+# detected on the server's shared interpreter pool instead of an interpreter of its own,
+# and last_result holds the timings of the last frame.
 class VisionDelegate:
     debug_initialized = False
-    _unclassifiedDetections: List[Dict[str, any]] = None
+    _unclassifiedDetections: np.ndarray = None
     _threadLock: Lock = None
-    img: Image
+    last_result: DetectionResult = None
     
-    def __init__(self, model_path, numthreads=32, threshold=0.5):
+    def __init__(self, model_path, numthreads=32, threshold=0.5, server: Union[InferenceServer, InferenceClient] = None):
         self._threshold = threshold
-        self._interpreter = tflite.Interpreter(model_path=model_path, num_threads=numthreads)
-        self._interpreter.allocate_tensors()
+        self._server = server
+        self._detector = ObjectDetector.from_model(model_path, numthreads, threshold) if server is None else None
         self._threadLock = Lock()
 
-        input_shape = self._interpreter.get_input_details()[0]['shape']
-        self._height = input_shape[1]
-        self._width = input_shape[2]
-        self._unclassifiedDetections = []
+        source = self._detector if server is None else server
+        self._height = source.height
+        self._width = source.width
+        self._unclassifiedDetections = np.empty(0, dtype=VISION_DETECTION_DTYPE)
         self._draw_init = False
-        self.img = None
+        self._frame = None
 
     def draw(self):
         if self.img is None:
@@ -57,27 +62,49 @@ class VisionDelegate:
         plt.draw()
         self.fig.canvas.flush_events()
 
+    # class and score of the best scoring detection within CP_THRESHOLD of each angle,
+    # -1 and -inf where there is none
+    def classify_angles(self, angles) -> Tuple[np.ndarray, np.ndarray]:
+        detections = self._unclassifiedDetections
+        angles = np.asarray(angles, dtype=np.float64)
+        if len(detections) == 0:
+            return np.full(len(angles), -1, dtype=np.int32), np.full(len(angles), -np.inf)
+        near = np.abs(angles[:, None] - detections['h_center']) <= CP_THRESHOLD
+        scores = np.where(near, detections['score'], -np.inf)
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(angles)), best]
+        classes = np.where(np.isfinite(best_scores), detections['class_id'][best], -1)
+        return classes, best_scores
+
     def get_detection_for_angle(self, angle) -> int:
-        for detection in self._unclassifiedDetections:
-            if abs(angle - detection['h_center']) <= CP_THRESHOLD:
-                return detection['class_id']
-        return -1
+        return int(self.classify_angles([angle])[0][0])
 
     def get_detection_for_centerpoint(self, centerpoint) -> int:
-        offset = np.arctan(centerpoint[1] / centerpoint[0])
-        for detection in self._unclassifiedDetections:
-            if abs(offset - detection['h_center']) <= CP_THRESHOLD:
-                return detection['class_id']
-        return -1
+        return self.get_detection_for_angle(np.arctan(centerpoint[1] / centerpoint[0]))
 
+    # image is a CameraFrame, or an RGB array
     def run_detection(self, image):
-        img = Image.fromarray(image).resize((self._width, self._height))
-        input_data = np.expand_dims(img, axis=0)
-        res = detect_objects(self._interpreter, input_data, self._threshold)
-        for r in res:
-            bbox = r['bounding_box']
-            x_center = ((bbox[3] - bbox[1]) / 2 + bbox[1])
-            # calculate how many degrees over
-            r['h_center'] = (x_center - 0.5) * pi / 2
+        frame = image if isinstance(image, CameraFrame) else CameraFrame.from_rgb(image)
+        if self._server is None:
+            detections = self._detector.detect_frame(frame)
+        else:
+            try:
+                self.last_result = self._server.detect(self, frame)
+            except CancelledError:
+                # a newer frame from this delegate replaced the request, or the server was stopped
+                return
+            detections = self.last_result.detections
+        res = np.empty(len(detections), dtype=VISION_DETECTION_DTYPE)
+        for name in DETECTION_DTYPE.names:
+            res[name] = detections[name]
+        bbox = detections['bounding_box']
+        x_center = ((bbox[:, 3] - bbox[:, 1]) / 2 + bbox[:, 1])
+        # calculate how many degrees over
+        res['h_center'] = (x_center - 0.5) * pi / 2
         self._unclassifiedDetections = res
-        self.img = img
+        self._frame = frame
+
+    @property
+    def img(self):
+        # only drawn for debugging, so the model sized copy is made on demand
+        return self._frame.resized(self._width, self._height) if self._frame is not None else None
@@ -8,6 +8,16 @@ import numpy as np
 ACTIVATION_WEIGHT = 10
 FRONT_ANGLE = np.pi / 16
 
+# angle of every slot, in [0, 2pi), and the slots each strategy looks at
+SLOT_ANGLES = np.arange(DISCRETIZATION_AMOUNT) / DISCRETIZATION_AMOUNT * np.pi * 2
+FRONT_SLOTS = SLOT_ANGLES < FRONT_ANGLE
+RIGHT_SLOTS = SLOT_ANGLES < np.pi
+LEFT_SLOTS = SLOT_ANGLES > np.pi
+NO_SLOTS = np.zeros(DISCRETIZATION_AMOUNT, dtype=bool)
+# slots on both sides of straight ahead that must be clear to stop braking
+_BRAKING_INDEX = round((FRONT_ANGLE / (2 * np.pi)) * DISCRETIZATION_AMOUNT)
+BRAKING_SLOTS = np.arange(-_BRAKING_INDEX, _BRAKING_INDEX + 1)
+
 class CollisionStrategy(enum.Enum):
     none = -1
     braking = 0
@@ -44,41 +54,34 @@ class CollisionWatchdog(Driver):
             self.swerveRight(currentSpeed)
             
         
-        for i, occptr in enumerate(self._angularOccupancy.occupancy_list):
-            if occptr == 0:
-                continue
-            
-            occ = self._angularOccupancy.occupant_reference[occptr]
-            if occ.weight < ACTIVATION_WEIGHT:
-                continue
-            
-            angle = (i / DISCRETIZATION_AMOUNT) * np.pi * 2
-
-            if (abs(angle) < FRONT_ANGLE) and occ.center_point[0] > 0:
-                # print("brake")
-                # print(f"for weight {occ.weight} and angle {angle}")
-                # print(occ.center_point)
-                self._collisionStrategy = CollisionStrategy.braking
-                self._drivingArbiter.requestSpeedControl(self, DriverPriority.High)
-                return
-            elif angle < (np.pi) and self._collisionStrategy != CollisionStrategy.right:
-                # print("swerve right")
-                # print(f"for weight {occ.weight} and angle {angle}")
-                # print(occ.center_point)
-                # print(occ.relative_velocity)
-                self._collisionStrategy = CollisionStrategy.right
-                self._drivingArbiter.requestSteeringControl(self, DriverPriority.High)
-                self._drivingArbiter.requestSpeedControl(self, DriverPriority.Medium)
-                return
-            elif angle > (np.pi) and self._collisionStrategy != CollisionStrategy.left:
-                # print("swerve left")
-                # print(f"for weight {occ.weight} and angle {angle}")
-                # print(occ.center_point)
-                # print(occ.relative_velocity)
-                self._collisionStrategy = CollisionStrategy.left
-                self._drivingArbiter.requestSteeringControl(self, DriverPriority.High)
-                self._drivingArbiter.requestSpeedControl(self, DriverPriority.Medium)
-                return
+        occupants = self._angularOccupancy.occupants
+        occ_ids = self._angularOccupancy.occupancy_list
+        # table row 0 is never used, so free slots read a weight of 0
+        threat = occupants.weight.take(occ_ids) >= ACTIVATION_WEIGHT
+        if not threat.any():
+            return
+        slots = np.flatnonzero(threat)
+        occ_ids = occ_ids[slots]
+        # the first threatening slot, in slot order, that calls for a change of strategy
+        brake = FRONT_SLOTS[slots] & (occupants.center_point[occ_ids, 0] > 0)
+        right = RIGHT_SLOTS[slots] if self._collisionStrategy != CollisionStrategy.right else NO_SLOTS[slots]
+        left = LEFT_SLOTS[slots] if self._collisionStrategy != CollisionStrategy.left else NO_SLOTS[slots]
+        act = brake | right | left
+        if not act.any():
+            return
+        i = np.argmax(act)
+
+        if brake[i]:
+            self._collisionStrategy = CollisionStrategy.braking
+            self._drivingArbiter.requestSpeedControl(self, DriverPriority.High)
+        elif right[i]:
+            self._collisionStrategy = CollisionStrategy.right
+            self._drivingArbiter.requestSteeringControl(self, DriverPriority.High)
+            self._drivingArbiter.requestSpeedControl(self, DriverPriority.Medium)
+        else:
+            self._collisionStrategy = CollisionStrategy.left
+            self._drivingArbiter.requestSteeringControl(self, DriverPriority.High)
+            self._drivingArbiter.requestSpeedControl(self, DriverPriority.Medium)
 
     def swerve(self, currentSpeed: float, dir: SwerveDirection):
         if currentSpeed > 8:
@@ -89,22 +92,16 @@ class CollisionWatchdog(Driver):
             self._speedController.brake = 0
         
         rightFree = True
-        for i in range(0, dir * DISCRETIZATION_AMOUNT // 2):
-            occptr = self._angularOccupancy.occupancy_list[i]
-            if occptr != 0:
-                occ = self._angularOccupancy.occupant_reference[occptr]
-                if occ.distance <= 30:
-                    self._swerveCount = self._swerveCount + dir
-                    self._steeringController.set_steering(dir * np.pi / 8)
-                    rightFree = False
-                    break
-                elif occ.distance <= 20:
-                    self._swerveCount = self._swerveCount + (dir * 2)
-                    self._steeringController.set_steering(dir * np.pi / 4)
-                    rightFree = False
-                    break
-                else:
-                    self._steeringController.set_steering(dir * np.pi / 32)
+        # a left swerve has no slots to check
+        occ_ids = self._angularOccupancy.occupancy_list[:max(dir * DISCRETIZATION_AMOUNT // 2, 0)]
+        occ_ids = occ_ids[occ_ids != 0]
+        if len(occ_ids) > 0:
+            if (self._angularOccupancy.occupants.distance[occ_ids] <= 30).any():
+                self._swerveCount = self._swerveCount + dir
+                self._steeringController.set_steering(dir * np.pi / 8)
+                rightFree = False
+            else:
+                self._steeringController.set_steering(dir * np.pi / 32)
 
         if rightFree:
             self._safeContinueCount += 1
@@ -133,13 +130,10 @@ class CollisionWatchdog(Driver):
         self._speedController.throttle = 0
         self._speedController.brake = 100
 
-        index = round((FRONT_ANGLE / (2 * np.pi)) * DISCRETIZATION_AMOUNT)
-        safe_to_continue = True
-        for i in range(-index, index + 1):
-            occptr = self._angularOccupancy.occupancy_list[i]
-            if occptr != 0:
-                occ = self._angularOccupancy.occupant_reference[occptr]
-                safe_to_continue = safe_to_continue and (occ.distance > 30) and (occ.weight < ACTIVATION_WEIGHT)
+        occ_ids = self._angularOccupancy.occupancy_list[BRAKING_SLOTS]
+        occ_ids = occ_ids[occ_ids != 0]
+        occupants = self._angularOccupancy.occupants
+        safe_to_continue = bool(np.all((occupants.distance[occ_ids] > 30) & (occupants.weight[occ_ids] < ACTIVATION_WEIGHT)))
         if safe_to_continue:
             if self._safeContinueCount >= 25:
                 # print("return")
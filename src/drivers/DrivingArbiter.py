@@ -1,6 +1,10 @@
+import heapq
+import itertools
+from functools import partial
 from airsim.client import CarClient
-from typing import Callable, List, NamedTuple
-from threading import Lock
+from airsim.types import CarControls
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from threading import RLock
 from drivers.Driver import Driver, DriverPriority
 
 class Requester(NamedTuple):
@@ -16,12 +20,21 @@ class Allocation:
         self.driver = driver
         self.priority = priority
 
-RequestQueue = List[Allocation]
+# heap of (-priority, arrival order, allocation), highest priority first and first come first served
+RequestQueue = List[Tuple[int, int, Allocation]]
 
 # Arbiters should be thread-safe by using locks to protect shared memory accesses.
+# Every state transition, including the onGranted/onRevoked callbacks it triggers, runs
+# under one reentrant lock, so drivers on the lane and vision threads always see grants
+# and revocations in order and a callback may request or give up control itself.
+# Waiting drivers sit in a heap with at most one live entry per driver: a driver asking
+# again while queued keeps its place unless it raised its priority, superseded entries
+# are skipped when popped.
 class Arbiter:
-    _queueLock: Lock = None
+    _queueLock: RLock = None
     _requestQueue: RequestQueue = None
+    # the live queue entry of every waiting driver, by id
+    _queued: Dict[str, Allocation] = None
     _currentAllocation: Allocation = None
 
     # After a Driver receives an allocation, it may return control to the previous Driver
@@ -30,103 +43,136 @@ class Arbiter:
 
     def __init__(self):
         self._requestQueue = []
-        self._queueLock = Lock()
+        self._queued = {}
+        self._arrivals = itertools.count()
+        self._queueLock = RLock()
 
-    # insert ahead of the first object you have priority over
-    def _findInsertIndex(self, priority: DriverPriority) -> int:        
-        for i, val in enumerate(self._requestQueue):
-            if priority.hasPriority(val):
-                return i
-        return len(self._requestQueue)
-
-    def requestControl(self, requester: Requester, priority: DriverPriority, returnControl=True) -> bool:
-        self._queueLock.acquire()
-        if self._currentAllocation is None:
-            self._queueLock.release()
-            self._currentAllocation = Allocation(requester, priority)
-            requester.onGranted()
-            return True
+    def _enqueue(self, allocation: Allocation):
+        queued = self._queued.get(allocation.driver.id)
+        if queued is not None and queued.priority.value >= allocation.priority.value:
+            return
+        self._queued[allocation.driver.id] = allocation
+        heapq.heappush(self._requestQueue, (-allocation.priority.value, next(self._arrivals), allocation))
 
-        # if they already have control, don't change grant
-        if (requester.id == self._currentAllocation.driver.id):
-            self._queueLock.release()
-            requester.onGranted()
-            return True
+    def _dequeue(self) -> Optional[Allocation]:
+        while self._requestQueue:
+            _, _, allocation = heapq.heappop(self._requestQueue)
+            if self._queued.get(allocation.driver.id) is allocation:
+                del self._queued[allocation.driver.id]
+                return allocation
+        return None
 
-        if DriverPriority.hasPriority(priority, self._currentAllocation.priority):
-            if returnControl:
-                self._returnDriver = self._currentAllocation
-            # revoke control
-            self._currentAllocation.driver.onRevoked(returnControl)
+    def requestControl(self, requester: Requester, priority: DriverPriority, returnControl=True) -> bool:
+        with self._queueLock:
+            current = self._currentAllocation
+            # if they already have control, don't change grant
+            if current is not None and requester.id == current.driver.id:
+                requester.onGranted()
+                return True
+
+            if current is not None and not DriverPriority.hasPriority(priority, current.priority):
+                self._enqueue(Allocation(requester, priority))
+                return False
+
+            if current is not None:
+                if returnControl:
+                    self._returnDriver = current
+                # revoke control
+                current.driver.onRevoked(returnControl)
+            self._queued.pop(requester.id, None)
             self._currentAllocation = Allocation(requester, priority)
-            self._queueLock.release()
             # grant control
             requester.onGranted()
             return True
-        else:
-            index = self._findInsertIndex(priority)
-            self._requestQueue.insert(index, Allocation(requester, priority))
-            self._queueLock.release()
-            return False
-    
-    def giveUpControl(self, requester: Requester):
-        self._queueLock.acquire()
-        # nop if not currently in control
-        if self._currentAllocation is None or requester.id != self._currentAllocation.driver.id:
-            self._queueLock.release()
-            return
-
-        requester.onRevoked(False)
-        
-        if self._returnDriver is not None:
-            self._currentAllocation = self._returnDriver
-            self._returnDriver = None
-            self._queueLock.release()
-            self._currentAllocation.driver.onGranted()
-            return
-
-        if len(self._requestQueue) == 0:
-            raise RuntimeError("giveUpControl called with no elements in the request queue")
-        
-        self._currentAllocation = self._requestQueue.pop(0)
-        self._queueLock.release()
-        self._currentAllocation.driver.onGranted()
 
+    # also withdraws a waiting request. Control passes to the driver it was taken from,
+    # if it is to be returned, otherwise to the first waiting driver, or to nobody.
+    def giveUpControl(self, requester: Requester):
+        with self._queueLock:
+            self._queued.pop(requester.id, None)
+            current = self._currentAllocation
+            # nop if not currently in control
+            if current is None or requester.id != current.driver.id:
+                if self._returnDriver is not None and requester.id == self._returnDriver.driver.id:
+                    self._returnDriver = None
+                return
+
+            requester.onRevoked(False)
+
+            if self._returnDriver is not None:
+                allocation = self._returnDriver
+                self._returnDriver = None
+                self._queued.pop(allocation.driver.id, None)
+            else:
+                allocation = self._dequeue()
+            self._currentAllocation = allocation
+            if allocation is not None:
+                allocation.driver.onGranted()
+
+# Keeps the authoritative CarControls for the car. The simulator is only read at startup
+# and on sync(), and sendBatch sends one setCarControls per tick, only when a controller
+# changed a value, so any number of controller writes in a tick coalesce into one RPC or none.
 class DrivingArbiter:
     def __init__(self, client: CarClient):
         self._client = client
         self._speedArbiter = Arbiter()
         self._steeringArbiter = Arbiter()
-        self._speedController = SpeedController(client)
-        self._steeringController = SteeringController(client)
+        self._controls = client.getCarControls()
+        self._speedController = SpeedController(self._controls)
+        self._steeringController = SteeringController(self._controls)
+        self._steeringRequesters: Dict[Driver, Requester] = {}
+        self._speedRequesters: Dict[Driver, Requester] = {}
+        self._sent = self._controlValues()
         # GracefulKiller(self._updating.clear)
 
+    def _controlValues(self):
+        return (self._speedController.throttle, self._speedController.brake, self._steeringController.steering)
+
+    # call after the simulator changed the controls behind the arbiter's back, e.g. on reset.
+    # The controllers keep their values, so they are sent again on the next sendBatch.
+    def sync(self):
+        self._controls = self._client.getCarControls()
+        self._sent = (self._controls.throttle, self._controls.brake, self._controls.steering)
+
+    # one requester per driver and control, built on first use
+    def _steeringRequester(self, driver: Driver) -> Requester:
+        requester = self._steeringRequesters.get(driver)
+        if requester is None:
+            requester = Requester(driver.id, partial(driver.onSteeringGranted, self._steeringController), driver.onSteeringRevoked)
+            self._steeringRequesters[driver] = requester
+        return requester
+
+    def _speedRequester(self, driver: Driver) -> Requester:
+        requester = self._speedRequesters.get(driver)
+        if requester is None:
+            requester = Requester(driver.id, partial(driver.onSpeedGranted, self._speedController), driver.onSpeedRevoked)
+            self._speedRequesters[driver] = requester
+        return requester
+
     def requestSteeringControl(self, driver: Driver, priority: DriverPriority, returnControl=True):
-        requester = Requester(driver.id, lambda: driver.onSteeringGranted(self._steeringController), driver.onSteeringRevoked)
-        return self._steeringArbiter.requestControl(requester, priority, returnControl)
+        return self._steeringArbiter.requestControl(self._steeringRequester(driver), priority, returnControl)
 
     def requestSpeedControl(self, driver: Driver, priority: DriverPriority, returnControl=True):
-        requester = Requester(driver.id, lambda: driver.onSpeedGranted(self._speedController), driver.onSpeedRevoked)
-        return self._speedArbiter.requestControl(requester, priority, returnControl)
+        return self._speedArbiter.requestControl(self._speedRequester(driver), priority, returnControl)
 
     def giveUpSteeringControl(self, driver: Driver):
-        requester = Requester(driver.id, lambda: driver.onSteeringGranted(self._steeringController), driver.onSteeringRevoked)
-        return self._steeringArbiter.giveUpControl(requester)
+        return self._steeringArbiter.giveUpControl(self._steeringRequester(driver))
 
     def giveUpSpeedControl(self, driver: Driver):
-        requester = Requester(driver.id, lambda: driver.onSpeedGranted(self._speedController), driver.onSpeedRevoked)
-        return self._speedArbiter.giveUpControl(requester)
+        return self._speedArbiter.giveUpControl(self._speedRequester(driver))
 
-    def sendBatch(self):
-        controls = self._client.getCarControls()
-        controls.throttle = self._speedController.throttle
-        controls.brake = self._speedController.brake
-        controls.steering = self._steeringController.steering
-        self._client.setCarControls(controls)
+    # returns whether the controls were sent
+    def sendBatch(self, force=False) -> bool:
+        values = self._controlValues()
+        if values == self._sent and not force:
+            return False
+        self._controls.throttle, self._controls.brake, self._controls.steering = values
+        self._client.setCarControls(self._controls)
+        self._sent = values
+        return True
 
 class SpeedController:
-    def __init__(self, client: CarClient):
-       controls = client.getCarControls()
+    def __init__(self, controls: CarControls):
        self.throttle = controls.throttle
        self.brake = controls.brake
 
@@ -136,6 +182,5 @@ class SteeringController:
     def set_steering(self, angle):
         self.steering = angle
 
-    def __init__(self, client: CarClient):
-        carControls = client.getCarControls()
-        self.steering = carControls.steering
+    def __init__(self, controls: CarControls):
+        self.steering = controls.steering
@@ -16,9 +16,12 @@ class LaneDetection(Driver):
     speedController: SpeedController = None
     _last_angle = None
 
-    def __init__(self, drivingArbiter: DrivingArbiter):
+    # with track_lanes, lane lines are tracked across frames by a LaneTracker
+    def __init__(self, drivingArbiter: DrivingArbiter, track_lanes=True):
         logging.info('Creating a lane_follower...')
         self._drivingArbiter = drivingArbiter
+        self._buffers = LaneBuffers()
+        self._tracker = LaneTracker() if track_lanes else None
         # self._killer = GracefulKiller(lambda: self.controlEvent.clear())
 
     def start(self):
@@ -41,17 +44,30 @@ class LaneDetection(Driver):
                 
     def follow_lane(self, frame, currentSpeed):
         if self.steeringController is None: return
-        # Main entry point of the lane follower
+        new_steering_angle = self.propose_steering(frame)
+        if new_steering_angle is None:
+            return frame
+        self.apply_steering(new_steering_angle, currentSpeed)
+
+    # Main entry point of the lane follower, returns None when no lane lines are found.
+    # Only touches the frame and _last_angle, so it can run away from the arbiter, see LaneDetectionProcess.
+    def propose_steering(self, frame):
         show_image("orig", frame)
-        lane_lines, new_frame = detect_lane(frame)        
+        if self._tracker is not None:
+            lane_lines, new_frame = self._tracker.detect(frame, self._buffers), frame
+        else:
+            lane_lines, new_frame = detect_lane(frame, self._buffers)
         if len(lane_lines) == 0:
             logging.error('No lane lines detected, nothing to do.')
-            return frame
+            return None
         new_steering_angle = compute_steering_angle(new_frame, lane_lines)
         if self._last_angle is not None:
             new_steering_angle = stabilize_steering_angle(self._last_angle, new_steering_angle, 2, 3)
         self._last_angle = new_steering_angle
+        return new_steering_angle
 
+    def apply_steering(self, new_steering_angle, currentSpeed):
+        if self.steeringController is None: return
         self.steeringController.set_steering(new_steering_angle)
         if self.speedController is not None:
             should_slow = currentSpeed > 8 or new_steering_angle >= 2
@@ -67,57 +83,59 @@ class LaneDetection(Driver):
 ############################
 # Frame processing steps
 ############################
-def detect_lane(frame):
+# top of the region searched for lane lines, as a fraction of the frame height
+ROI_TOP = 1 / 3
+
+# Output buffers for the edge detection steps, reused while the frame size stays the same
+class LaneBuffers:
+    shape = None
+
+    def get(self, shape):
+        if shape != self.shape:
+            self.shape = shape
+            self.hsv = np.empty(shape, dtype=np.uint8)
+            self.mask = np.empty(shape[:2], dtype=np.uint8)
+            self.edges = np.empty(shape[:2], dtype=np.uint8)
+        return self
+
+def detect_lane(frame, buffers: LaneBuffers = None):
     logging.debug('detecting lane lines...')
 
-    edges = detect_edges(frame)
-    show_image('edges', edges)
-
-    cropped_edges = region_of_interest(edges)
-    show_image('edges cropped', cropped_edges)
+    # only the bottom of the frame can hold lane lines, so everything runs on that slice
+    top = int(frame.shape[0] * ROI_TOP)
+    edges = detect_edges(frame[top:], buffers)
+    show_image('edges cropped', edges)
 
     line_segments = detect_line_segments(edges)
-    line_segment_image = display_lines(frame, line_segments)
-    show_image("line segments", line_segment_image)
+    if line_segments is not None:
+        # back to frame coordinates
+        line_segments[..., 1::2] += top
+    if _SHOW_IMAGE:
+        show_image("line segments", display_lines(frame, line_segments))
 
     lane_lines = average_slope_intercept(frame, line_segments)
-    lane_lines_image = display_lines(frame, lane_lines)
-    show_image("lane lines", lane_lines_image)
+    if _SHOW_IMAGE:
+        show_image("lane lines", display_lines(frame, lane_lines))
 
-    return lane_lines, lane_lines_image
+    return lane_lines, frame
 
 
-def detect_edges(frame):
-    # filter for blue lane lines
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+def detect_edges(frame, buffers: LaneBuffers = None):
+    buffers = (buffers if buffers is not None else LaneBuffers()).get(frame.shape)
+    # filter for the lane lines. Frames are RGB and the hue range was tuned on them read
+    # as BGR, where the yellow lines and the curb fall into it, so keep the conversion as is
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=buffers.hsv)
     show_image("hsv", hsv)
     lower_blue = np.array([60, 40, 40])
     upper_blue = np.array([150, 255, 255])
-    mask = cv2.inRange(hsv, lower_blue, upper_blue)
+    mask = cv2.inRange(hsv, lower_blue, upper_blue, dst=buffers.mask)
     show_image("blue mask", mask)
 
     # detect edges
-    edges = cv2.Canny(mask, 100, 200)
+    edges = cv2.Canny(mask, 100, 200, edges=buffers.edges)
 
     return edges
 
-def region_of_interest(canny):
-    height, width = canny.shape
-    mask = np.zeros_like(canny)
-
-    # only focus bottom half of the screen
-    polygon = np.array([[
-        (0, height * 1 / 3),
-        (width, height * 1 / 3),
-        (width, height),
-        (0, height),
-    ]], np.int32)
-
-    cv2.fillPoly(mask, polygon, 255)
-    # show_image("mask", mask)
-    masked_image = cv2.bitwise_and(canny, mask)
-    return masked_image
-
 
 def detect_line_segments(cropped_edges):
     # tuning min_threshold, minLineLength, maxLineGap is a trial and error process by hand
@@ -128,59 +146,66 @@ def detect_line_segments(cropped_edges):
     maxLineGap=4
     line_segments = cv2.HoughLinesP(cropped_edges, rho, angle, min_threshold, np.array([]), minLineLength,maxLineGap)
 
-    if line_segments is not None:
-        for line_segment in line_segments:
+    if line_segments is not None and logging.getLogger().isEnabledFor(logging.DEBUG):
+        for line_segment in line_segments.reshape(-1, 4):
             logging.debug('detected line_segment:')
-            logging.debug("%s of length %s" % (line_segment, length_of_line_segment(line_segment[0])))
+            logging.debug("%s of length %s" % (line_segment, length_of_line_segment(line_segment)))
 
     return line_segments
 
 
-def average_slope_intercept(frame, line_segments):
+def average_slope_intercept(frame, line_segments, length_weighted=False):
     """
     This function combines line segments into one or two lane lines
     If all line slopes are < 0: then we only have detected left lane
     If all line slopes are > 0: then we only have detected right lane
+    With length_weighted, longer segments count for more in the average
     """
-    lane_lines = []
+    lane_lines = [line for line in fit_lane_sides(frame, line_segments, length_weighted) if line is not None]
+    logging.debug('lane lines: %s' % lane_lines)  # [[[316, 720, 484, 432]], [[1009, 720, 718, 432]]]
+    return lane_lines
+
+
+# slopes, intercepts and lengths of every segment at once, vertical segments are dropped.
+# HoughLinesP returns (n, 1, 4) segments
+def segment_fits(line_segments):
+    segments = np.asarray(line_segments, dtype=np.float64).reshape(-1, 4)
+    vertical = segments[:, 0] == segments[:, 2]
+    if np.any(vertical):
+        logging.info('skipping %d vertical line segments (slope=inf)' % np.count_nonzero(vertical))
+        segments = segments[~vertical]
+    x1, y1, x2, y2 = segments.T
+    slopes = (y2 - y1) / (x2 - x1)
+    intercepts = y1 - slopes * x1
+    lengths = np.hypot(x2 - x1, y2 - y1)
+    return segments, slopes, intercepts, lengths
+
+
+# [left lane line, right lane line], either is None when no segment falls in its region
+def fit_lane_sides(frame, line_segments, length_weighted=False):
     if line_segments is None:
         logging.info('No line_segment segments detected')
-        return lane_lines
+        return [None, None]
 
     height, width, _ = frame.shape
-    left_fit = []
-    right_fit = []
-
     boundary = 1/3
     left_region_boundary = width * (1 - boundary)  # left lane line segment should be on left 2/3 of the screen
     right_region_boundary = width * boundary # right lane line segment should be on left 2/3 of the screen
 
-    for line_segment in line_segments:
-        for x1, y1, x2, y2 in line_segment:
-            if x1 == x2:
-                logging.info('skipping vertical line segment (slope=inf): %s' % line_segment)
-                continue
-            fit = np.polyfit((x1, x2), (y1, y2), 1)
-            slope = fit[0]
-            intercept = fit[1]
-            # if slope < 0:
-            if x1 < left_region_boundary and x2 < left_region_boundary:
-                left_fit.append((slope, intercept))
-            # else:
-            if x1 > right_region_boundary and x2 > right_region_boundary:
-                right_fit.append((slope, intercept))
-
-    left_fit_average = np.average(left_fit, axis=0)
-    if len(left_fit) > 0:
-        lane_lines.append(make_points(frame, left_fit_average))
-
-    right_fit_average = np.average(right_fit, axis=0)
-    if len(right_fit) > 0:
-        lane_lines.append(make_points(frame, right_fit_average))
-
-    logging.debug('lane lines: %s' % lane_lines)  # [[[316, 720, 484, 432]], [[1009, 720, 718, 432]]]
-
-    return lane_lines
+    segments, slopes, intercepts, lengths = segment_fits(line_segments)
+    x1, x2 = segments[:, 0], segments[:, 2]
+    # a segment can fall in both regions
+    left = (x1 < left_region_boundary) & (x2 < left_region_boundary)
+    right = (x1 > right_region_boundary) & (x2 > right_region_boundary)
+    sides = []
+    for region in (left, right):
+        if not np.any(region):
+            sides.append(None)
+            continue
+        weights = lengths[region] if length_weighted else None
+        fit_average = (np.average(slopes[region], weights=weights), np.average(intercepts[region], weights=weights))
+        sides.append(make_points(frame, fit_average))
+    return sides
 
 
 def compute_steering_angle(frame, lane_lines):
@@ -222,8 +247,7 @@ def stabilize_steering_angle(curr_steering_angle, new_steering_angle, num_of_lan
     
     angle_deviation = new_steering_angle - curr_steering_angle
     if abs(angle_deviation) > max_angle_deviation:
-        stabilized_steering_angle = int(curr_steering_angle
-                                        + max_angle_deviation * angle_deviation / abs(angle_deviation))
+        stabilized_steering_angle = curr_steering_angle + max_angle_deviation * angle_deviation / abs(angle_deviation)
     else:
         stabilized_steering_angle = new_steering_angle
     logging.info('Proposed angle: %s, stabilized angle: %s' % (new_steering_angle, stabilized_steering_angle))
@@ -238,7 +262,7 @@ def display_lines(frame, lines, line_color=(0, 255, 0), line_width=10):
     if lines is not None:
         for line in lines:
             for x1, y1, x2, y2 in line:
-                cv2.line(line_image, (x1, y1), (x2, y2), line_color, line_width)
+                cv2.line(line_image, (int(x1), int(y1)), (int(x2), int(y2)), line_color, line_width)
     line_image = cv2.addWeighted(frame, 0.8, line_image, 1, 1)
     return line_image
 
@@ -272,8 +296,9 @@ def length_of_line_segment(line):
     return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
 
 
-def show_image(title, frame, show=_SHOW_IMAGE):
-    if show:
+# only shows anything when a viewer is attached by setting _SHOW_IMAGE
+def show_image(title, frame, show=None):
+    if show if show is not None else _SHOW_IMAGE:
         cv2.imshow(title, frame)
 
 
@@ -283,9 +308,122 @@ def make_points(frame, line):
     y1 = height  # bottom of the frame
     y2 = int(y1 * 1 / 2)  # make points from middle of the frame down
 
-    # bound the coordinates within the frame
-    x1 = max(-width, min(2 * width, int((y1 - intercept) / slope)))
-    x2 = max(-width, min(2 * width, int((y2 - intercept) / slope)))
+    # bound the coordinates within the frame, a horizontal line ends up on the bounds
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.nan_to_num((np.array((y1, y2)) - intercept) / slope)
+    x1, x2 = (int(max(-width, min(2 * width, v))) for v in x)
+    return [[x1, y1, x2, y2]]
+
+
+############################
+# Lane tracking
+############################
+# half width in pixels of the band searched around a predicted lane line
+BAND_HALF_WIDTH = 12
+# edge pixels needed in a band to count as a detection
+MIN_BAND_PIXELS = 20
+# consecutive frames a lane line may go undetected before it is dropped
+MAX_MISSES = 3
+# standard deviations in pixels of the frame to frame motion of a lane line and of its measurement
+PROCESS_NOISE = 4.0
+MEASUREMENT_NOISE = 6.0
+
+# Kalman filter on one lane line. The line is kept as its x position at the bottom and the
+# middle of the frame, the rows make_points uses, rather than as slope and intercept,
+# since steep lane lines make the slope blow up. Both follow a random walk.
+class LaneLineFilter:
+    def __init__(self, line):
+        x1, self.y1, x2, self.y2 = line[0]
+        self.x = np.array((x1, x2), dtype=np.float64)
+        self.P = np.eye(2) * MEASUREMENT_NOISE ** 2
+        self.misses = 0
+
+    def predict(self):
+        self.P = self.P + np.eye(2) * PROCESS_NOISE ** 2
+
+    def update(self, line):
+        x1, _, x2, _ = line[0]
+        R = np.eye(2) * MEASUREMENT_NOISE ** 2
+        K = self.P @ np.linalg.inv(self.P + R)
+        self.x = self.x + K @ (np.array((x1, x2), dtype=np.float64) - self.x)
+        self.P = (np.eye(2) - K) @ self.P
+        self.misses = 0
+
+    @property
+    def line(self):
+        return [[self.x[0], self.y1, self.x[1], self.y2]]
+
+# Carries the left and right lane lines from frame to frame.
+# While both are tracked, edges are only detected in a narrow band around each predicted line.
+# A line that goes unseen for MAX_MISSES frames is dropped, and while either line is
+# missing the whole region of interest is searched, as detect_lane does.
+class LaneTracker:
+    def __init__(self):
+        self.filters = [None, None]
+
+    def detect(self, frame, buffers: LaneBuffers = None):
+        for f in self.filters:
+            if f is not None:
+                f.predict()
+
+        if all(f is not None for f in self.filters):
+            measurements = [search_band(frame, f.line) for f in self.filters]
+        else:
+            top = int(frame.shape[0] * ROI_TOP)
+            line_segments = detect_line_segments(detect_edges(frame[top:], buffers))
+            if line_segments is not None:
+                line_segments[..., 1::2] += top
+            measurements = fit_lane_sides(frame, line_segments)
+
+        for side, measurement in enumerate(measurements):
+            f = self.filters[side]
+            if measurement is None:
+                if f is not None:
+                    f.misses += 1
+                    if f.misses >= MAX_MISSES:
+                        self.filters[side] = None
+            elif f is None:
+                self.filters[side] = LaneLineFilter(measurement)
+            else:
+                f.update(measurement)
+
+        lane_lines = [f.line for f in self.filters if f is not None]
+        if _SHOW_IMAGE:
+            show_image("lane lines", display_lines(frame, lane_lines))
+        return lane_lines
+
+# the lane line through the edge pixels within BAND_HALF_WIDTH of the predicted line, or None
+def search_band(frame, line):
+    height, width, _ = frame.shape
+    top = int(height * ROI_TOP)
+    x1, y1, x2, y2 = line[0]
+    # x of the predicted line at the top of the region of interest
+    x_top = x1 + (x2 - x1) * (top - y1) / (y2 - y1)
+    left = max(0, int(min(x1, x_top)) - BAND_HALF_WIDTH)
+    right = min(width, int(max(x1, x_top)) + BAND_HALF_WIDTH + 1)
+    if right - left <= BAND_HALF_WIDTH:
+        return None
+
+    edges = detect_edges(frame[top:, left:right])
+    band = np.array([[
+        (x1 - BAND_HALF_WIDTH - left, y1 - top),
+        (x1 + BAND_HALF_WIDTH - left, y1 - top),
+        (x_top + BAND_HALF_WIDTH - left, 0),
+        (x_top - BAND_HALF_WIDTH - left, 0),
+    ]], np.int32)
+    mask = np.zeros_like(edges)
+    cv2.fillPoly(mask, band, 255)
+    cv2.bitwise_and(edges, mask, dst=edges)
+
+    # the band is narrow enough to fit the line straight to its edge pixels, without Hough
+    points = cv2.findNonZero(edges)
+    if points is None or len(points) < MIN_BAND_PIXELS:
+        return None
+    xs = points[:, 0, 0] + left
+    ys = points[:, 0, 1] + top
+    slope, intercept = np.polyfit(ys, xs, 1)
+    # x = slope * y + intercept, at the rows of the predicted line
+    x1, x2 = (max(-width, min(2 * width, slope * y + intercept)) for y in (y1, y2))
     return [[x1, y1, x2, y2]]
 
 if __name__ == '__main__':
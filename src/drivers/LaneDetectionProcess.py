@@ -0,0 +1,123 @@
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from threading import Lock, Thread
+from typing import Tuple
+import numpy as np
+from drivers.LaneDetection import LaneDetection
+
+RING_SLOTS = 3
+
+# Fixed-size camera frames in shared memory. The owner writes a frame into the next slot
+# and sends only the slot number, the other process reads the slot in place.
+class SharedFrameRing:
+    def __init__(self, shape, slots = RING_SLOTS, name = None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        size = slots * int(np.prod(self.shape))
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._next = 0
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def write(self, frame: np.ndarray) -> int:
+        slot = self._next
+        np.copyto(self.frames[slot], frame)
+        self._next = (slot + 1) % self.slots
+        return slot
+
+    def close(self):
+        del self.frames
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+def _lane_worker(jobs: Connection, proposals: Connection):
+    laneDetection = LaneDetection(None)
+    ring = None
+    while True:
+        message = jobs.recv()
+        if message is None:
+            break
+        if message[0] == "attach":
+            _, name, shape, slots = message
+            if ring is not None:
+                ring.close()
+            ring = SharedFrameRing(shape, slots, name)
+            continue
+        _, slot, currentSpeed = message
+        try:
+            proposals.send((laneDetection.propose_steering(ring.frames[slot]), currentSpeed))
+        except Exception:
+            logging.exception("lane detection failed")
+            proposals.send((None, currentSpeed))
+    if ring is not None:
+        ring.close()
+
+# Runs LaneDetection.propose_steering in a separate process so the lane pipeline does not
+# compete with the lidar and occupancy code for the GIL. Same run/is_running interface as
+# the RerunableThread it replaces: one frame is in flight at a time and run() is ignored
+# while the worker is busy. Proposals are applied to the arbiter's controllers by a
+# receiver thread as soon as they arrive.
+class LaneDetectionProcess:
+    def __init__(self, laneDetection: LaneDetection):
+        self._laneDetection = laneDetection
+        self._ring: SharedFrameRing = None
+        self._lock = Lock()
+        self._busy = False
+        context = multiprocessing.get_context("spawn")
+        jobs, self._jobs = context.Pipe(duplex=False)
+        self._proposals, proposals = context.Pipe(duplex=False)
+        self._process = context.Process(target=_lane_worker, args=(jobs, proposals), name="lane-detection", daemon=True)
+        self._process.start()
+        self._receiver = Thread(target=self._receive, name="lane-proposals", daemon=True)
+        self._receiver.start()
+
+    @property
+    def is_running(self) -> bool:
+        return self._busy
+
+    def run(self, args: Tuple):
+        frame, currentSpeed = args
+        with self._lock:
+            if self._busy:
+                return
+            self._busy = True
+        sent = False
+        try:
+            if self._ring is None or self._ring.shape != frame.shape:
+                if self._ring is not None:
+                    self._ring.close()
+                self._ring = SharedFrameRing(frame.shape)
+                self._jobs.send(("attach", self._ring.name, self._ring.shape, self._ring.slots))
+            self._jobs.send(("frame", self._ring.write(frame), currentSpeed))
+            sent = True
+        finally:
+            # a frame that never reached the worker gets no proposal to clear it
+            if not sent:
+                with self._lock:
+                    self._busy = False
+
+    def _receive(self):
+        while True:
+            try:
+                new_steering_angle, currentSpeed = self._proposals.recv()
+            except EOFError:
+                return
+            try:
+                if new_steering_angle is not None:
+                    self._laneDetection.apply_steering(new_steering_angle, currentSpeed)
+            finally:
+                with self._lock:
+                    self._busy = False
+
+    def close(self):
+        self._jobs.send(None)
+        self._process.join()
+        if self._ring is not None:
+            self._ring.close()
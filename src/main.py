@@ -1,20 +1,33 @@
 import pathlib
 from argparse import ArgumentParser
-from time import time
+from utils.clock import wall_clock
 
 from airsim.client import CarClient
-import numpy
 
 from daq.LidarDelegate import LidarDelegate
 from daq.VisionDelegate import VisionDelegate
 from drivers.CollisionWatchdog import CollisionWatchdog
 from drivers.DrivingArbiter import DrivingArbiter
 from drivers.LaneDetection import LaneDetection
+from drivers.LaneDetectionProcess import LaneDetectionProcess
 from managers.AngularOccupancy import AngularOccupancy
-from utils.cv_utils import get_image
+from utils.threat_utils import ttc_weigh_batch
+from utils.cv_utils import get_frame
 from utils.RerunableThread import RerunableThread
+from daq.SensorPrefetcher import SensorPrefetcher
+from sim.SensorLog import RecordingCarClient, ReplayCarClient
+from utils.instrumentation import FileExporter, Instrumentation, MqttExporter, StdoutExporter
+from utils.scheduler import RateScheduler
+from MainClass import CONTROL_RATE, DRAW_RATE, LANE_RATE, TELEMETRY_RATE, VISION_RATE
 from pstats import SortKey
 
+try:
+    from NEATModel import neat_weigh_batch as weigh_batch
+except Exception as e:
+    # no trained model or NEAT config next to the working directory
+    print(f"NEAT model unavailable ({e}), weighing occupants by time to collision")
+    weigh_batch = ttc_weigh_batch
+
 # New (From bcwadsworth MQTT bit)
 import paho.mqtt.client as mqtt
 
@@ -38,6 +51,64 @@ if __name__ == '__main__':
         type=int,
         default=32
     )
+    parser.add_argument(
+        '--record',
+        default=None,
+        help='log the lidar, camera and car state of every tick to this file'
+    )
+    parser.add_argument(
+        '--replay',
+        default=None,
+        help='run headless against a recorded sensor log instead of AirSim'
+    )
+    parser.add_argument(
+        '--latency',
+        nargs='+',
+        choices=['stdout', 'file', 'mqtt'],
+        default=[],
+        help='time every stage of the loop and export the latency histograms'
+    )
+    parser.add_argument(
+        '--latency-file',
+        default='latency.jsonl'
+    )
+    parser.add_argument(
+        '--latency-interval',
+        type=float,
+        default=10.0
+    )
+    parser.add_argument(
+        '--prefetch',
+        action='store_true',
+        help='fetch the next tick\'s camera, lidar and car state on separate connections while the current tick runs'
+    )
+    parser.add_argument(
+        '--lane-process',
+        action='store_true',
+        help='run lane detection in a separate process instead of a thread'
+    )
+    parser.add_argument(
+        '--control-rate',
+        type=float,
+        default=CONTROL_RATE,
+        help='Hz of the lidar and collision watchdog path'
+    )
+    parser.add_argument(
+        '--lane-rate',
+        type=float,
+        default=LANE_RATE
+    )
+    parser.add_argument(
+        '--vision-rate',
+        type=float,
+        default=VISION_RATE
+    )
+    parser.add_argument(
+        '--telemetry-rate',
+        type=float,
+        default=TELEMETRY_RATE,
+        help='Hz at which the occupants are published'
+    )
 
     try:
         # New (From bcwadsworth MQTT bit)
@@ -51,39 +122,95 @@ if __name__ == '__main__':
 
 
     args = parser.parse_args()
-    carClient = CarClient()
+    if args.prefetch and args.record is not None:
+        parser.error("--record logs the loop's own client and cannot be combined with --prefetch")
+    newClient = (lambda: ReplayCarClient(args.replay)) if args.replay is not None else CarClient
+    carClient = newClient()
+    if args.record is not None:
+        carClient = RecordingCarClient(carClient, args.record)
+    exporters = {
+        'stdout': lambda: StdoutExporter(),
+        'file': lambda: FileExporter(args.latency_file),
+        'mqtt': lambda: MqttExporter(client),
+    }
+    instrumentation = Instrumentation(len(args.latency) > 0, [exporters[e]() for e in args.latency], args.latency_interval)
+    stage = instrumentation.stage
     carClient.confirmConnection()
     carClient.enableApiControl(True)
     drivingArbiter = DrivingArbiter(carClient)
     visionDelegate = VisionDelegate(args.model, args.numthreads, args.threshold)
     laneDetection = LaneDetection(drivingArbiter)
-    angularOccupancy = AngularOccupancy(client)
+    angularOccupancy = AngularOccupancy(client, visionDelegate)
     lidarDriver = LidarDelegate(angularOccupancy)
     collisionWatchdog = CollisionWatchdog(drivingArbiter, angularOccupancy)
     laneDetection.start()
-    lastLoop = time()
-    laneThread = RerunableThread(laneDetection.follow_lane)
+    sensors = SensorPrefetcher(newClient) if args.prefetch else None
+    if args.lane_process:
+        laneThread = LaneDetectionProcess(laneDetection)
+    else:
+        laneThread = RerunableThread(laneDetection.follow_lane, 'follow_lane', instrumentation=instrumentation)
+
+    # log frames hold every sensor, so the camera is read with the lidar while recording or replaying
+    cameraEveryTick = sensors is not None or args.record is not None or args.replay is not None
+    latest = {'image': None, 'speed': 0.0}
 
-    delays = numpy.zeros(50)
-    i = 0
-    while True:
-        if i == 50:
-            a = numpy.average(delays)
-            print(f"Average loop time {a}s")
-            i = 0
-        loopDelay = time() - lastLoop
-        delays[i] = loopDelay
-        i += 1
-        lastLoop = time()
-        drivingArbiter.sendBatch()
-        img = get_image(carClient)
-        lidarData = carClient.getLidarData('MyLidar1')
-        currentSpeed = carClient.getCarState().speed
-        lidarDriver.checkLidar(lidarData)
-        collisionWatchdog.runLoop(currentSpeed)
+    def control():
+        with stage('sendBatch'):
+            drivingArbiter.sendBatch()
+        if sensors is not None:
+            with stage('acquire'):
+                sensorTick = sensors.next()
+            latest['image'], lidarData, latest['speed'] = sensorTick.image, sensorTick.lidar_data, sensorTick.car_state.speed
+        else:
+            if cameraEveryTick:
+                with stage('get_image'):
+                    latest['image'] = get_frame(carClient)
+            with stage('getLidarData'):
+                lidarData = carClient.getLidarData('MyLidar1')
+            with stage('getCarState'):
+                latest['speed'] = carClient.getCarState().speed
+        with stage('checkLidar'):
+            lidarDriver.checkLidar(lidarData)
+        with stage('reweigh'):
+            angularOccupancy.reweigh(weigh_batch)
+        with stage('runLoop'):
+            collisionWatchdog.runLoop(latest['speed'])
+        with stage('decay'):
+            angularOccupancy.decay()
+        with stage('expire'):
+            angularOccupancy.expire_occupants()
+        instrumentation.tick()
+
+    def followLane():
+        if not cameraEveryTick:
+            with stage('get_image'):
+                latest['image'] = get_frame(carClient)
         if not laneThread.is_running:
-            laneThread.run((img, currentSpeed))
-        angularOccupancy.decay()
-        angularOccupancy.expire_occupants()
-        angularOccupancy.sendobj()
-        angularOccupancy.draw()
+            laneThread.run((latest['image'].rgb, latest['speed']))
+
+    def categorize():
+        if latest['image'] is not None:
+            angularOccupancy.categorize(latest['image'])
+
+    def report():
+        for name, stats in scheduler.summary().items():
+            print(f"{name:<12} runs {stats['runs']:>8} deadline misses {stats['misses']:>6} shed {stats['shed']:>6}")
+
+    scheduler = RateScheduler(wall_clock, instrumentation)
+    scheduler.every('control', args.control_rate, control)
+    scheduler.every('lane', args.lane_rate, followLane)
+    scheduler.every('categorize', args.vision_rate, categorize, sheddable=True)
+    scheduler.every('sendobj', args.telemetry_rate, angularOccupancy.sendobj, sheddable=True)
+    scheduler.every('draw', DRAW_RATE, angularOccupancy.draw, sheddable=True)
+    scheduler.every('report', 0.1, report, sheddable=True)
+    try:
+        scheduler.run()
+    except EOFError:
+        print("Reached the end of the sensor log")
+    finally:
+        if sensors is not None:
+            sensors.stop()
+        if args.lane_process:
+            laneThread.close()
+        if args.record is not None:
+            carClient.close()
@@ -21,13 +21,15 @@
 
 from threading import Lock
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from daq.VisionDelegate import VisionDelegate
 from managers.Occupant import Occupant
+from managers.OccupantTable import OccupantTable
 import matplotlib.pyplot as plt
 
-from uuid import uuid4
 from utils.RerunableThread import RerunableThread
+from utils.clock import Clock, wall_clock
+from utils.telemetry import TelemetryPublisher
 
 from utils.lidar_utils import distance_of_point
 
@@ -37,44 +39,104 @@ OCCUPANT_UPDATE_DISTANCE = 2
 DEFAULT_SEARCH_RANGE = 2
 EXPIRATION_PROBABILITY = 0.4
 
+# slots in front of the car that the camera can see, and their angles
+CAMERA_SLOTS = np.arange(-(DISCRETIZATION_AMOUNT // 8), DISCRETIZATION_AMOUNT // 8)
+CAMERA_SLOT_ANGLES = CAMERA_SLOTS * ANGULAR_DISCRETIZATION
+
+SlotRange = Tuple[int, int]
+
+# converts an inclusive range of possibly negative (wrapping) slot indices
+# into at most two [start, end) slices of the occupancy list
+def slot_ranges(start_index, end_index) -> Tuple[SlotRange, ...]:
+    stop_index = end_index + 1
+    if stop_index <= start_index:
+        return ()
+    if stop_index - start_index >= DISCRETIZATION_AMOUNT:
+        return ((0, DISCRETIZATION_AMOUNT),)
+    start = start_index % DISCRETIZATION_AMOUNT
+    stop = stop_index % DISCRETIZATION_AMOUNT or DISCRETIZATION_AMOUNT
+    if start < stop:
+        return ((start, stop),)
+    return ((start, DISCRETIZATION_AMOUNT), (0, stop))
+
 class AngularOccupancy:
-    occupancy_list: List[int]
+    # slots hold occupant ids, 0 means the slot is free
+    occupancy_list: np.ndarray
     occupant_reference: Dict[int, Occupant]
-
-    def __init__(self, client = None, visionDelegate: VisionDelegate = None):
-        self.occupancy_list = [0] * DISCRETIZATION_AMOUNT
+    # occupant details, one row per occupant id
+    occupants: OccupantTable
+    # reverse index of the slots each occupant was last assigned
+    _occupant_slots: Dict[int, Tuple[SlotRange, ...]]
+    _free_ids: List[int]
+
+    # occupants are published through telemetry, by default a TelemetryPublisher on client
+    def __init__(self, client = None, visionDelegate: VisionDelegate = None, clock: Clock = wall_clock, telemetry: TelemetryPublisher = None):
+        self.occupancy_list = np.zeros(DISCRETIZATION_AMOUNT, dtype=np.int32)
         self.occupant_reference = {}
+        self.occupants = OccupantTable(clock=clock)
+        self._occupant_slots = {}
+        self._free_ids = []
+        self._next_id = 1
         self._draw_init = False
         self._client = client
+        if telemetry is None and client is not None:
+            telemetry = TelemetryPublisher(client, clock=clock)
+        self._telemetry = telemetry
         self.visionDelegate = visionDelegate
-        self.visionThread = RerunableThread(self.visionDelegate.run_detection)
+        self.visionThread = RerunableThread(self.visionDelegate.run_detection) if visionDelegate is not None else None
+
+    def _add_occupant(self, center_point) -> int:
+        if self._free_ids:
+            occ_id = self._free_ids.pop()
+        else:
+            occ_id = self._next_id
+            self._next_id += 1
+        self.occupant_reference[occ_id] = self.occupants.insert(occ_id, center_point)
+        return occ_id
+
+    def _remove_occupant(self, occ_id):
+        self.occupant_reference.pop(occ_id).kill()
+        self._clear_slots(occ_id)
+        self._free_ids.append(occ_id)
+
+    def _clear_slots(self, occ_id):
+        for start, stop in self._occupant_slots.pop(occ_id, ()):
+            # other occupants may have taken over part of the range since
+            slots = self.occupancy_list[start:stop]
+            slots[slots == occ_id] = 0
+
+    def _assign_slots(self, occ_id, start_index, end_index):
+        ranges = slot_ranges(start_index, end_index)
+        for start, stop in ranges:
+            self.occupancy_list[start:stop] = occ_id
+        self._occupant_slots[occ_id] = ranges
 
     def _occupant_search(self, centering_on, search_range = DEFAULT_SEARCH_RANGE):
         center_index = round(centering_on / (2 * np.pi) * DISCRETIZATION_AMOUNT)
-        for i in range(center_index - search_range, center_index + search_range + 1):
-            o = self.occupancy_list[i]
-            if o != 0:
-                return o
-        return None
+        window = self.occupancy_list.take(range(center_index - search_range, center_index + search_range + 1), mode='wrap')
+        occupied = np.flatnonzero(window)
+        if len(occupied) == 0:
+            return None
+        return int(window[occupied[0]])
 
     def categorize(self, frame):
         if self.visionDelegate is None:
             return
         if self.visionThread.is_running:
-            hasCategorizable = False
-            searchRange = DISCRETIZATION_AMOUNT // 8
-            for i in range(-searchRange, searchRange):
-                if self.occupancy_list[i] != 0:
-                    hasCategorizable = True
-                    break
-            if not hasCategorizable:
+            occ_ids = self.occupancy_list[CAMERA_SLOTS]
+            occupied = np.flatnonzero(occ_ids)
+            if len(occupied) == 0:
                 return
 
-            categorized_id = 0
-            for i in range(-searchRange, searchRange):
-                if self.occupancy_list[i] != 0 and categorized_id != self.occupancy_list[i]:
-                    angle = (i / DISCRETIZATION_AMOUNT) * (np.pi * 2)
-                    self.occupant_reference[self.occupancy_list[i]].update(classification=self.visionDelegate.get_detection_for_angle(angle))
+            occ_ids = occ_ids[occupied]
+            classes, scores = self.visionDelegate.classify_angles(CAMERA_SLOT_ANGLES[occupied])
+            # every occupant takes the class of its best scoring slot
+            order = np.lexsort((-scores, occ_ids))
+            occ_ids = occ_ids[order]
+            best = np.ones(len(order), dtype=bool)
+            best[1:] = occ_ids[1:] != occ_ids[:-1]
+            for occ_id, classification in zip(occ_ids[best].tolist(), classes[order][best].tolist()):
+                self.occupant_reference[occ_id].update(classification=classification)
             return
         self.visionThread.run((frame,))
 
@@ -92,25 +154,18 @@ class AngularOccupancy:
             self._draw_init = True
 
         plt.cla()
-        x = []
-        y = []
-        last_label = None
-        for i in range(0, DISCRETIZATION_AMOUNT):
-            if self.occupancy_list[i] != 0:
-                occ = self.occupant_reference[self.occupancy_list[i]]
-                if occ.weight >= 20 or True:
-
-                    angle = i / DISCRETIZATION_AMOUNT * 2.0 * np.pi - (np.pi / 2)
-                    tx = np.cos(angle)
-                    ty = np.sin(angle)
-                    x.append(tx)
-                    y.append(ty)
-
-                    if last_label != self.occupancy_list[i]:
-                        last_label = self.occupancy_list[i]
-                        self.ax.text(tx, ty + 0.1, "{:.2f}".format(self.occupant_reference[self.occupancy_list[i]].distance))
-                        # self.ax.text(tx, ty + 0.1, angle)
-                
+        slots = np.flatnonzero(self.occupancy_list)
+        occ_ids = self.occupancy_list[slots]
+        angles = slots / DISCRETIZATION_AMOUNT * 2.0 * np.pi - (np.pi / 2)
+        x = np.cos(angles)
+        y = np.sin(angles)
+
+        # label each run of slots belonging to the same occupant once
+        labeled = np.ones(len(slots), dtype=bool)
+        labeled[1:] = occ_ids[1:] != occ_ids[:-1]
+        for tx, ty, occ_id in zip(x[labeled], y[labeled], occ_ids[labeled]):
+            self.ax.text(tx, ty + 0.1, "{:.2f}".format(self.occupant_reference[occ_id].distance))
+
         self.ax.set_aspect(1)
         self.ax.plot(self.circx, self.circy)
         self.ax.scatter(x, y)
@@ -118,34 +173,23 @@ class AngularOccupancy:
         self.fig.canvas.flush_events()
 
     def sendobj(self):
-        if self._client is None:
+        if self._telemetry is None:
             return
-        arr = [];
-        for x in self.occupant_reference:
-            obj = self.occupant_reference[x];
-            if obj.probability <= EXPIRATION_PROBABILITY:
-                arr.append(x)
-            else:
-                self._client.publish("objects", "{\"id\": \"%d\", \"posx\": %3f, \"posy\": %3f, \"classify\": %d}" %(x, obj.center_point[0], obj.center_point[1], obj.classification));
+        self.expire_occupants()
 
-        for x in arr:
-            self.occupant_reference.pop(x).kill()
+        rows = self.occupants.live_rows()
+        self._telemetry.publish(rows, self.occupants.center_point[rows], self.occupants.classification[rows])
 
     def decay(self):
-        for id in self.occupant_reference:
-            self.occupant_reference[id].decay()
+        self.occupants.decay()
+
+    def reweigh(self, weigh_batch):
+        self.occupants.reweigh(weigh_batch)
 
     def expire_occupants(self):
-        for i in range(0, DISCRETIZATION_AMOUNT):
-            occ_ptr = self.occupancy_list[i]
-            if occ_ptr != 0:
-                if occ_ptr in self.occupant_reference:
-                    occ = self.occupant_reference[occ_ptr]
-                    if occ.probability <= EXPIRATION_PROBABILITY:
-                        self.occupant_reference.pop(occ_ptr).kill()
-                        self.occupancy_list[i] = 0
-                else:
-                    self.occupancy_list[i] = 0
+        # removing an occupant always clears its slots, so there are no dangling ids to sweep
+        for occ_ptr in self.occupants.expired(EXPIRATION_PROBABILITY).tolist():
+            self._remove_occupant(occ_ptr)
 
     def occupant_from_blobs(self, blobs):
         for b in blobs:
@@ -163,27 +207,20 @@ class AngularOccupancy:
         mid_angle = (start_angle + end_angle) / 2
 
         curr_occ_ptr = self._occupant_search(mid_angle)
-        new_occ = Occupant(new_blob[len(new_blob) // 2])
-        new_ptr = uuid4().int
+        center_point = new_blob[len(new_blob) // 2]
         if curr_occ_ptr is not None:
-            occ = self.occupant_reference[curr_occ_ptr]
             # if big distance jump, keep closer
-            if abs(occ.distance - new_occ.distance) > 20:
-                occ.kill()
-                self.occupant_reference.pop(curr_occ_ptr)
-                self.occupant_reference[new_ptr] = new_occ
-            # otherwise update
+            if abs(self.occupants.distance[curr_occ_ptr] - distance_of_point(center_point, (0, 0))) > 20:
+                self._remove_occupant(curr_occ_ptr)
+                new_ptr = self._add_occupant(center_point)
+            # otherwise update, a fresh scan carries no classification
             else:
                 new_ptr = curr_occ_ptr
-                occ.update_with(new_occ)
-                new_occ.kill()
-            for i in range(0, DISCRETIZATION_AMOUNT):
-                    if self.occupancy_list[i] == curr_occ_ptr:
-                        self.occupancy_list[i] = 0
+                self.occupants.update(curr_occ_ptr, classification=-1, center_point=center_point)
+                self._clear_slots(curr_occ_ptr)
         else:
-            self.occupant_reference[new_ptr] = new_occ
+            new_ptr = self._add_occupant(center_point)
         # insert new pointers
         start_index = round(start_angle / (2 * np.pi) * DISCRETIZATION_AMOUNT)
         end_index = round(end_angle / (2 * np.pi) * DISCRETIZATION_AMOUNT)
-        for i in range(start_index, end_index + 1): 
-            self.occupancy_list[i] = new_ptr
+        self._assign_slots(new_ptr, start_index, end_index)
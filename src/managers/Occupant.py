@@ -1,105 +1,56 @@
 import numpy as np
 from typing import Tuple
-from time import time_ns
-from NEATModel import neat_weigh
-from utils.lidar_utils import distance_of_point
 
 DECAY_FACTOR = 0.70
 DECAY_BIAS = 0.05
 DECAY_DELAY = 0.5
 
-DANGER_REGION = 1
-
 ROC_UPDATE_TIME = 1
+
+def _column(name):
+    return property(
+        lambda self: getattr(self._table, name)[self._row],
+        lambda self, value: getattr(self._table, name).__setitem__(self._row, value)
+    )
+
+# A lightweight view of one row of an OccupantTable.
+# The occupant details live in the table columns so they can be processed in batches.
 class Occupant:
-    center_point: Tuple[np.float32, np.float32]
-    center_angle: np.float32
-    distance: np.float32
-    relative_speed: np.float32
-    relative_velocity: Tuple[np.float32, np.float32]
+    __slots__ = ('_table', '_row')
 
-    classification: int
-    
-    weight: np.float32
-    weight_roc: np.float32
-    probability: np.float32
+    center_point: Tuple[np.float32, np.float32] = _column('center_point')
+    center_angle: np.float32 = _column('center_angle')
+    distance: np.float32 = _column('distance')
+    relative_speed: np.float32 = _column('relative_speed')
+    relative_velocity: Tuple[np.float32, np.float32] = _column('relative_velocity')
 
-    _last_update_time: int
+    classification: int = _column('classification')
 
-    def __init__(self, center_point, center_angle = None, classification = -1):
-        self.classification = classification
-        self.relative_speed = 0
-        self.center_point = center_point
-        if center_angle is not None:
-            self.center_angle = center_angle
-        else:
-            self.center_angle = np.arctan2(center_point[0], center_point[1])
+    weight: np.float32 = _column('weight')
+    weight_roc: np.float32 = _column('weight_roc')
+    probability: np.float32 = _column('probability')
 
-        self.distance = distance_of_point(center_point, (0, 0))
-        self.weight_roc = 0
-        self.probability = 0.75
-        self._last_update_time = time_ns()
-        self.relative_velocity = (0, 0)
-        self.weight = 0.0
-        
-        # self._timer = Timer(DECAY_DELAY, self._decay)
-        # self._timer.start()
+    _last_update_time: int = _column('last_update_time')
 
-    # def _decay(self):
-    #     self.probability = (self.probability * DECAY_FACTOR) - DECAY_BIAS
-    #     self._timer = Timer(DECAY_DELAY, self._decay)
-    #     self._timer.start()
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    @property
+    def id(self) -> int:
+        return self._row
 
     def decay(self):
         self.probability = (self.probability * DECAY_FACTOR) - DECAY_BIAS
 
     def kill(self):
-        pass
-        # self._timer.cancel()
-
-    def update_with(self, other):
-        self.update(other.classification, other.center_point)
+        self._table.remove(self._row)
 
     def update(self, classification = None, center_point = None):
-        update_time = time_ns()
-        time_delta = update_time - self._last_update_time
-        if time_delta < ROC_UPDATE_TIME:
-            return
-        self.probability = min(1, self.probability * (1 + DECAY_FACTOR) + DECAY_BIAS)
-
-        if classification is not None:
-            self.classification = classification
-        if center_point is not None:
-            new_distance = distance_of_point(center_point, (0, 0))
-            self.relative_speed = (self.distance - new_distance) * 1e9 / (time_delta)
-            self.relative_velocity = (center_point - self.center_point) * 1e9 / (time_delta)
-            self.distance = new_distance
-            self.center_point = center_point
-
-        new_weight = self.weigh()
-        # self.weight_roc = (new_weight - self.weight) / (time_delta)
-        self._last_update_time = time_ns()
-        self.weight = new_weight
+        self._table.update(self._row, classification, center_point)
 
     def set_weight(self, new_weight):
         self.weight = new_weight
-    
-    def weigh(self) -> float:
-        w =  self.weight
-        return w
-        w = 0
-        if abs(self.center_angle) < (np.pi / 8):
-            bias = 5
-            s_check = 3
-            w += 10 / self.distance
-        else:
-            bias = 2
-            s_check = 2
 
-        for i in range(1, 101):
-            s_off = s_check/i
-            predicted_location = (self.center_point[0] + self.relative_velocity[0] * s_off, self.center_point[1] + self.relative_velocity[1] * s_off)
-            if abs(predicted_location[0]) < DANGER_REGION and predicted_location[1] < DANGER_REGION:
-                w += (bias - s_off)
-
-        return (w ) * self.probability
\ No newline at end of file
+    def weigh(self) -> float:
+        return self.weight
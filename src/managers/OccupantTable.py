@@ -0,0 +1,126 @@
+from typing import Callable
+import numpy as np
+
+from managers.Occupant import DECAY_BIAS, DECAY_FACTOR, ROC_UPDATE_TIME, Occupant
+from utils.clock import Clock, wall_clock
+from utils.lidar_utils import distance_of_point
+
+INITIAL_CAPACITY = 64
+# center_angle, center_point x/y, distance, relative_velocity x/y, relative_speed
+NUM_FEATURES = 7
+
+# name, per-row shape and dtype of every column
+_COLUMNS = (
+    ('center_point', (2,), np.float64),
+    ('center_angle', (), np.float64),
+    ('distance', (), np.float64),
+    ('relative_speed', (), np.float64),
+    ('relative_velocity', (2,), np.float64),
+    ('classification', (), np.int32),
+    ('weight', (), np.float64),
+    ('weight_roc', (), np.float64),
+    ('probability', (), np.float64),
+    ('last_update_time', (), np.int64),
+    ('alive', (), bool),
+)
+
+# Structure-of-arrays store for the occupant details.
+# Rows are indexed by occupant id, row 0 is never used since id 0 marks a free occupancy slot.
+class OccupantTable:
+    center_point: np.ndarray
+    center_angle: np.ndarray
+    distance: np.ndarray
+    relative_speed: np.ndarray
+    relative_velocity: np.ndarray
+
+    classification: np.ndarray
+
+    weight: np.ndarray
+    weight_roc: np.ndarray
+    probability: np.ndarray
+
+    last_update_time: np.ndarray
+    alive: np.ndarray
+
+    def __init__(self, capacity = INITIAL_CAPACITY, clock: Clock = wall_clock):
+        self._clock = clock
+        self.capacity = 0
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        for name, shape, dtype in _COLUMNS:
+            column = np.zeros((capacity,) + shape, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                column[:len(old)] = old
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    def insert(self, row, center_point, center_angle = None, classification = -1) -> Occupant:
+        if row >= self.capacity:
+            self._grow(max(row + 1, self.capacity * 2))
+
+        self.classification[row] = classification
+        self.relative_speed[row] = 0
+        self.center_point[row] = center_point
+        if center_angle is not None:
+            self.center_angle[row] = center_angle
+        else:
+            self.center_angle[row] = np.arctan2(center_point[0], center_point[1])
+
+        self.distance[row] = distance_of_point(center_point, (0, 0))
+        self.weight_roc[row] = 0
+        self.probability[row] = 0.75
+        self.last_update_time[row] = self._clock.time_ns()
+        self.relative_velocity[row] = (0, 0)
+        self.weight[row] = 0.0
+        self.alive[row] = True
+        return Occupant(self, row)
+
+    def remove(self, row):
+        self.alive[row] = False
+
+    def update(self, row, classification = None, center_point = None):
+        update_time = self._clock.time_ns()
+        time_delta = update_time - self.last_update_time[row]
+        self.probability[row] = min(1, self.probability[row] * (1 + DECAY_FACTOR) + DECAY_BIAS)
+
+        if classification is not None:
+            self.classification[row] = classification
+        if center_point is not None:
+            new_distance = distance_of_point(center_point, (0, 0))
+            # a simulated clock may not have moved since the last update
+            if time_delta >= ROC_UPDATE_TIME:
+                self.relative_speed[row] = (self.distance[row] - new_distance) * 1e9 / (time_delta)
+                self.relative_velocity[row] = (center_point - self.center_point[row]) * 1e9 / (time_delta)
+            self.distance[row] = new_distance
+            self.center_point[row] = center_point
+
+        self.last_update_time[row] = self._clock.time_ns()
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def decay(self):
+        live = self.alive
+        self.probability[live] = (self.probability[live] * DECAY_FACTOR) - DECAY_BIAS
+
+    def expired(self, threshold) -> np.ndarray:
+        return np.flatnonzero(self.alive & (self.probability <= threshold))
+
+    # (n, NUM_FEATURES) matrix in the input order of the weighting model
+    def features(self, rows: np.ndarray) -> np.ndarray:
+        features = np.empty((len(rows), NUM_FEATURES), dtype=np.float64)
+        features[:, 0] = self.center_angle[rows]
+        features[:, 1:3] = self.center_point[rows]
+        features[:, 3] = self.distance[rows]
+        features[:, 4:6] = self.relative_velocity[rows]
+        features[:, 6] = self.relative_speed[rows]
+        return features
+
+    # weigh_batch maps a feature matrix to one weight per row
+    def reweigh(self, weigh_batch: Callable[[np.ndarray], np.ndarray]):
+        rows = self.live_rows()
+        if len(rows) == 0:
+            return
+        self.weight[rows] = weigh_batch(self.features(rows))
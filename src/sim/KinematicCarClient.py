@@ -0,0 +1,150 @@
+import numpy as np
+from airsim.types import CarControls, CarState, CollisionInfo, ImageResponse, KinematicsState, LidarData, Pose, Vector3r
+from utils.clock import Clock, wall_clock
+
+MAX_ACCELERATION = 4.0
+MAX_DECELERATION = 8.0
+DRAG = 0.1
+WHEELBASE = 2.7
+MAX_STEERING_ANGLE = np.pi / 6
+LIDAR_RANGE = 50
+# half length and half width of the car, obstacle points inside count as a collision
+CAR_EXTENT = (2.5, 1.0)
+# the physics is integrated in steps no longer than this
+MAX_STEP = 0.05
+IMAGE_SIZE = (144, 256)
+
+# A lightweight kinematic stand-in for the AirSim CarClient, for headless runs.
+# The world is a static set of obstacle points, usually a recorded lidar sweep.
+# The car follows a bicycle model driven by the last controls sent, and the lidar
+# returns the obstacle points in range in the car frame (x forward, y right).
+# The physics follows the clock. While paused it only moves on simContinueForTime,
+# which integrates immediately, so it can be lock-stepped with a SimulatedClock.
+class KinematicCarClient:
+    def __init__(self, obstacles: np.ndarray, start_position=(0.0, 0.0), start_yaw=0.0, clock: Clock = wall_clock):
+        self._obstacles = np.asarray(obstacles, dtype=np.float64)[:, :2]
+        self._start_position = np.array(start_position, dtype=np.float64)
+        self._start_yaw = start_yaw
+        self._clock = clock
+        self._paused = False
+        self.reset()
+
+    # a lidar sweep (point_cloud layout or (n, 3) array) taken at the start pose
+    @staticmethod
+    def from_lidar_points(points, start_position=(0.0, 0.0), start_yaw=0.0, clock: Clock = wall_clock):
+        points = np.reshape(np.asarray(points, dtype=np.float64), (-1, 3))
+        c, s = np.cos(start_yaw), np.sin(start_yaw)
+        world = np.stack((c * points[:, 0] - s * points[:, 1], s * points[:, 0] + c * points[:, 1]), axis=-1)
+        return KinematicCarClient(world + start_position, start_position, start_yaw, clock)
+
+    @staticmethod
+    def from_file(path, clock: Clock = wall_clock):
+        return KinematicCarClient.from_lidar_points(np.load(path), clock=clock)
+
+    def reset(self):
+        self._position = self._start_position.copy()
+        self._yaw = self._start_yaw
+        self._speed = 0.0
+        self._has_collided = False
+        self._controls = CarControls()
+        self._last_step = self._clock.time()
+
+    def confirmConnection(self):
+        return True
+
+    def enableApiControl(self, is_enabled, vehicle_name=''):
+        pass
+
+    def simPause(self, is_paused):
+        self._step()
+        self._paused = is_paused
+
+    def simIsPause(self):
+        return self._paused
+
+    def simContinueForTime(self, seconds):
+        self._step()
+        self._advance(seconds)
+
+    def _step(self):
+        now = self._clock.time()
+        elapsed = now - self._last_step
+        self._last_step = now
+        if not self._paused:
+            self._advance(elapsed)
+
+    def _advance(self, elapsed):
+        while elapsed > 0:
+            dt = min(elapsed, MAX_STEP)
+            elapsed -= dt
+            self._integrate(dt)
+
+    def _integrate(self, dt):
+        if self._has_collided:
+            self._speed = 0.0
+            return
+        controls = self._controls
+        acceleration = controls.throttle * MAX_ACCELERATION - min(controls.brake, 1) * MAX_DECELERATION - DRAG * self._speed
+        self._speed = max(0.0, self._speed + acceleration * dt)
+        steering_angle = np.clip(controls.steering, -1, 1) * MAX_STEERING_ANGLE
+        self._yaw += self._speed * np.tan(steering_angle) / WHEELBASE * dt
+        self._position += self._speed * dt * np.array((np.cos(self._yaw), np.sin(self._yaw)))
+        local = self._obstacles_in_car_frame()
+        self._has_collided = bool(np.any((np.abs(local[:, 0]) <= CAR_EXTENT[0]) & (np.abs(local[:, 1]) <= CAR_EXTENT[1])))
+
+    def _obstacles_in_car_frame(self):
+        offset = self._obstacles - self._position
+        c, s = np.cos(self._yaw), np.sin(self._yaw)
+        return np.stack((c * offset[:, 0] + s * offset[:, 1], -s * offset[:, 0] + c * offset[:, 1]), axis=-1)
+
+    @staticmethod
+    def _copy_controls(controls):
+        copy = CarControls()
+        copy.throttle = controls.throttle
+        copy.brake = controls.brake
+        copy.steering = controls.steering
+        return copy
+
+    def getCarControls(self, vehicle_name=''):
+        return self._copy_controls(self._controls)
+
+    # copied like the RPC would, callers may keep mutating their CarControls
+    def setCarControls(self, controls, vehicle_name=''):
+        self._step()
+        self._controls = self._copy_controls(controls)
+
+    def getCarState(self, vehicle_name=''):
+        self._step()
+        state = CarState()
+        state.speed = self._speed
+        # airsim's CarState shares one class level KinematicsState between instances
+        state.kinematics_estimated = KinematicsState()
+        state.kinematics_estimated.position = Vector3r(self._position[0], self._position[1], 0.0)
+        return state
+
+    def simGetVehiclePose(self, vehicle_name=''):
+        self._step()
+        return Pose(Vector3r(self._position[0], self._position[1], 0.0))
+
+    def simGetCollisionInfo(self, vehicle_name=''):
+        self._step()
+        info = CollisionInfo()
+        info.has_collided = self._has_collided
+        return info
+
+    def getLidarData(self, lidar_name='', vehicle_name=''):
+        self._step()
+        local = self._obstacles_in_car_frame()
+        local = local[np.hypot(local[:, 0], local[:, 1]) <= LIDAR_RANGE]
+        points = np.zeros((len(local), 3), dtype=np.float32)
+        points[:, :2] = local
+        data = LidarData()
+        data.point_cloud = points.ravel().tolist()
+        return data
+
+    # there is no renderer, the camera always sees a blank frame
+    def simGetImages(self, requests, vehicle_name=''):
+        response = ImageResponse()
+        response.height, response.width = IMAGE_SIZE
+        response.image_data_uint8 = bytes(IMAGE_SIZE[0] * IMAGE_SIZE[1] * 3)
+        return [response for _ in requests]
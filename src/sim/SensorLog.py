@@ -0,0 +1,240 @@
+import struct
+from typing import List
+import numpy as np
+from airsim.types import CarControls, CarState, CollisionInfo, ImageResponse, KinematicsState, LidarData, Pose, Quaternionr, Vector3r
+
+# Sensor log layout, all little endian:
+#   file header    MAGIC, version (u4)
+#   frames         FRAME_HEADER, lidar points (f4, num_points x 3), image (u1, height x width x 3)
+#   frame index    one u8 file offset per frame
+#   footer         index offset (u8), frame count (u8), MAGIC
+# Every section starts on an ALIGNMENT boundary so frames can be viewed in place
+# from a memory map. Frames are buffered and written CHUNK_FRAMES at a time.
+MAGIC = b"DBSL"
+VERSION = 1
+ALIGNMENT = 8
+CHUNK_FRAMES = 32
+
+FILE_HEADER = struct.Struct("<4sI")
+FOOTER = struct.Struct("<QQ4s")
+FRAME_HEADER = np.dtype([
+    ('timestamp_ns', '<i8'),
+    ('speed', '<f8'),
+    ('position', '<f8', 3),
+    ('orientation', '<f8', 4),
+    ('num_points', '<u4'),
+    ('image_height', '<u4'),
+    ('image_width', '<u4'),
+    ('has_collided', 'u1'),
+], align=True)
+
+def _padding(size):
+    return -size % ALIGNMENT
+
+class SensorLogWriter:
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._file.write(bytes(_padding(FILE_HEADER.size)))
+        self._offset = self._file.tell()
+        self._offsets: List[int] = []
+        self._chunk: List[bytes] = []
+
+    def write_frame(self, timestamp_ns, lidar_points: np.ndarray, image: np.ndarray, car_state: CarState, has_collided=False):
+        lidar_points = np.ascontiguousarray(lidar_points, dtype='<f4').reshape(-1, 3)
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        kinematics = car_state.kinematics_estimated
+        header = np.zeros((), dtype=FRAME_HEADER)
+        header['timestamp_ns'] = timestamp_ns
+        header['speed'] = car_state.speed
+        header['position'] = (kinematics.position.x_val, kinematics.position.y_val, kinematics.position.z_val)
+        header['orientation'] = (kinematics.orientation.w_val, kinematics.orientation.x_val, kinematics.orientation.y_val, kinematics.orientation.z_val)
+        header['num_points'] = len(lidar_points)
+        header['image_height'], header['image_width'] = image.shape[:2]
+        header['has_collided'] = has_collided
+
+        self._offsets.append(self._offset)
+        for section in (header.tobytes(), lidar_points.tobytes(), image.tobytes()):
+            self._chunk.append(section)
+            self._chunk.append(bytes(_padding(len(section))))
+            self._offset += len(section) + _padding(len(section))
+        if len(self._offsets) % CHUNK_FRAMES == 0:
+            self.flush()
+
+    def flush(self):
+        self._file.write(b"".join(self._chunk))
+        self._chunk = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        index_offset = self._offset
+        self._file.write(np.array(self._offsets, dtype='<u8').tobytes())
+        self._file.write(FOOTER.pack(index_offset, len(self._offsets), MAGIC))
+        self._file.close()
+
+class SensorFrame:
+    def __init__(self, header, lidar_points: np.ndarray, image: np.ndarray):
+        self.header = header
+        self.lidar_points = lidar_points
+        self.image = image
+
+    @property
+    def timestamp_ns(self) -> int:
+        return int(self.header['timestamp_ns'])
+
+# Reads a sensor log through a memory map. Frames are views into the map, nothing is copied.
+class SensorLogReader:
+    def __init__(self, path):
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} sensor log")
+        index_offset, frame_count, magic = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} has no frame index, it was not closed properly")
+        self.offsets = np.frombuffer(self._map, dtype='<u8', count=frame_count, offset=index_offset)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index) -> SensorFrame:
+        offset = int(self.offsets[index])
+        header = self._map[offset:offset + FRAME_HEADER.itemsize].view(FRAME_HEADER)[0]
+        offset += FRAME_HEADER.itemsize + _padding(FRAME_HEADER.itemsize)
+
+        num_points = int(header['num_points'])
+        lidar_size = num_points * 3 * 4
+        lidar_points = self._map[offset:offset + lidar_size].view('<f4').reshape(num_points, 3)
+        offset += lidar_size + _padding(lidar_size)
+
+        height, width = int(header['image_height']), int(header['image_width'])
+        image = self._map[offset:offset + height * width * 3].reshape(height, width, 3)
+        return SensorFrame(header, lidar_points, image)
+
+# Wraps a CarClient and logs the lidar, camera and car state it returns.
+# A frame is written once all three have been read, normally once per tick.
+class RecordingCarClient:
+    def __init__(self, client, path, lidar_name='MyLidar1'):
+        self._client = client
+        self._writer = SensorLogWriter(path)
+        self._lidar_name = lidar_name
+        self._pending = {}
+        self._has_collided = False
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _capture(self, kind, value):
+        self._pending[kind] = value
+        if len(self._pending) == 3:
+            lidar, (image, timestamp), state = self._pending['lidar'], self._pending['image'], self._pending['state']
+            self._writer.write_frame(timestamp, lidar, image, state, self._has_collided)
+            self._pending = {}
+
+    def getLidarData(self, lidar_name='', vehicle_name=''):
+        data = self._client.getLidarData(lidar_name=lidar_name, vehicle_name=vehicle_name)
+        if lidar_name == self._lidar_name:
+            self._capture('lidar', np.array(data.point_cloud, dtype=np.float32).reshape(-1, 3))
+        return data
+
+    def simGetImages(self, requests, vehicle_name=''):
+        responses = self._client.simGetImages(requests, vehicle_name=vehicle_name)
+        response = responses[0]
+        image = np.frombuffer(response.image_data_uint8, dtype=np.uint8).reshape(response.height, response.width, 3)
+        self._capture('image', (image, response.time_stamp))
+        return responses
+
+    def getCarState(self, vehicle_name=''):
+        state = self._client.getCarState(vehicle_name=vehicle_name)
+        self._capture('state', state)
+        return state
+
+    def simGetCollisionInfo(self, vehicle_name=''):
+        info = self._client.simGetCollisionInfo(vehicle_name=vehicle_name)
+        self._has_collided = info.has_collided
+        return info
+
+    def close(self):
+        self._writer.close()
+
+# Serves a recorded sensor log in place of a CarClient.
+# A frame is served until one of its sensors is read a second time, then the log
+# moves to the next frame, so each tick sees one frame. Car controls are accepted and ignored.
+class ReplayCarClient:
+    def __init__(self, path, loop=False):
+        self._log = SensorLogReader(path)
+        self._loop = loop
+        self._index = 0
+        self._served = set()
+        self._controls = None
+
+    @property
+    def frame_index(self) -> int:
+        return self._index
+
+    def _frame(self, kind) -> SensorFrame:
+        if kind in self._served:
+            if self._index + 1 < len(self._log):
+                self._index += 1
+            elif self._loop:
+                self._index = 0
+            else:
+                raise EOFError("end of sensor log")
+            self._served = set()
+        self._served.add(kind)
+        return self._log[self._index]
+
+    def confirmConnection(self):
+        return True
+
+    def enableApiControl(self, is_enabled, vehicle_name=''):
+        pass
+
+    def reset(self):
+        self._index = 0
+        self._served = set()
+
+    def getCarControls(self, vehicle_name=''):
+        return self._controls if self._controls is not None else CarControls()
+
+    def setCarControls(self, controls, vehicle_name=''):
+        self._controls = controls
+
+    def getLidarData(self, lidar_name='', vehicle_name=''):
+        frame = self._frame('lidar')
+        data = LidarData()
+        data.point_cloud = frame.lidar_points.ravel()
+        data.time_stamp = frame.timestamp_ns
+        return data
+
+    def simGetImages(self, requests, vehicle_name=''):
+        frame = self._frame('image')
+        response = ImageResponse()
+        response.height, response.width = frame.image.shape[:2]
+        response.image_data_uint8 = frame.image.data
+        response.time_stamp = frame.timestamp_ns
+        return [response for _ in requests]
+
+    def getCarState(self, vehicle_name=''):
+        header = self._frame('state').header
+        state = CarState()
+        state.speed = float(header['speed'])
+        state.timestamp = int(header['timestamp_ns'])
+        # airsim's CarState shares one class level KinematicsState between instances
+        state.kinematics_estimated = KinematicsState()
+        state.kinematics_estimated.position, state.kinematics_estimated.orientation = self._pose(header)
+        return state
+
+    @staticmethod
+    def _pose(header):
+        w, x, y, z = header['orientation'].tolist()
+        return Vector3r(*header['position'].tolist()), Quaternionr(x, y, z, w)
+
+    def simGetVehiclePose(self, vehicle_name=''):
+        return Pose(*self._pose(self._log[self._index].header))
+
+    def simGetCollisionInfo(self, vehicle_name=''):
+        info = CollisionInfo()
+        info.has_collided = bool(self._log[self._index].header['has_collided'])
+        return info
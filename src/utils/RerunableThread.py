@@ -1,31 +1,79 @@
-from typing import Tuple
-from threading import Event, Thread
-from time import sleep
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Deque, Tuple
+from utils.instrumentation import Instrumentation, disabled
 
 
+class _Job:
+    __slots__ = ("args", "future", "submitted_ns")
+
+    def __init__(self, args: Tuple):
+        self.args = args
+        self.future = Future()
+        self.submitted_ns = time.perf_counter_ns()
+
+
+# Runs target on a worker thread every time run() is called.
+# The worker sleeps on a condition variable and wakes as soon as work is submitted.
+# With coalesce, a job still waiting when a new one arrives is cancelled, so a
+# busy worker always picks up the latest frame next instead of working through a backlog.
+# Queue wait and execution times are recorded as the "<name>.wait" and "<name>" stages.
 class RerunableThread:
     args: Tuple = None
+    last_wait: float = 0.0
+    last_run: float = 0.0
 
     @property
     def is_running(self) -> bool:
-        return self._is_running.is_set()
+        with self._condition:
+            return self._running or len(self._jobs) > 0
 
-    def __init__(self, target, name=None):
-        self._is_running = Event()
+    def __init__(self, target, name=None, coalesce=True, instrumentation: Instrumentation = disabled):
         self._target = target
-        self._thread = Thread(target=self._threadRunLoop, name=name)
-        self._thread.setDaemon(True)
+        self._name = name if name is not None else getattr(target, "__name__", "worker")
+        self._coalesce = coalesce
+        self._instrumentation = instrumentation
+        self._condition = Condition()
+        self._jobs: Deque[_Job] = deque()
+        self._running = False
+        self._thread = Thread(target=self._threadRunLoop, name=name, daemon=True)
         self._thread.start()
 
-    def run(self, args: Tuple):
-        # print(args)
-        self.args = args
-        self._is_running.set()
+    def run(self, args: Tuple) -> Future:
+        job = _Job(args)
+        with self._condition:
+            if self._coalesce:
+                while self._jobs:
+                    self._jobs.popleft().future.cancel()
+            self._jobs.append(job)
+            self.args = args
+            self._condition.notify()
+        return job.future
 
     def _threadRunLoop(self):
         while True:
-            if self._is_running.is_set():
-                self._target(*(self.args))
-                self._is_running.clear()
-            else:
-                sleep(0.01)
+            with self._condition:
+                while not self._jobs:
+                    self._condition.wait()
+                job = self._jobs.popleft()
+                self._running = True
+
+            if job.future.set_running_or_notify_cancel():
+                start = time.perf_counter_ns()
+                try:
+                    job.future.set_result(self._target(*job.args))
+                except BaseException as e:
+                    logging.exception("%s failed", self._name)
+                    job.future.set_exception(e)
+                end = time.perf_counter_ns()
+                self.last_wait = (start - job.submitted_ns) / 1e9
+                self.last_run = (end - start) / 1e9
+                if self._instrumentation.enabled:
+                    self._instrumentation.record(f"{self._name}.wait", start - job.submitted_ns)
+                    self._instrumentation.record(self._name, end - start)
+
+            with self._condition:
+                self._running = False
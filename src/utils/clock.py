@@ -0,0 +1,33 @@
+import time
+from abc import ABC, abstractmethod
+
+# Time source for the tracker, the trainer and the simulator stand-ins.
+# Everything that measures elapsed time reads it from an injected clock so runs
+# can be lock-stepped with the simulator instead of following wall-clock time.
+class Clock(ABC):
+    def time(self) -> float:
+        return self.time_ns() / 1e9
+
+    @abstractmethod
+    def time_ns(self) -> int:
+        pass
+
+class WallClock(Clock):
+    def time(self) -> float:
+        return time.time()
+
+    def time_ns(self) -> int:
+        return time.time_ns()
+
+# Only moves when advanced, typically by one simulator step per tick
+class SimulatedClock(Clock):
+    def __init__(self, start_ns = 0):
+        self._now_ns = start_ns
+
+    def time_ns(self) -> int:
+        return self._now_ns
+
+    def advance(self, seconds: float):
+        self._now_ns += round(seconds * 1e9)
+
+wall_clock = WallClock()
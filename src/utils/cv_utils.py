@@ -18,44 +18,108 @@ class_names = [
     'unknown'
 ]
 
-def get_image(client: CarClient):
+# A camera frame that wraps the RPC image buffer without copying it.
+# The colour conversions and the detector input are computed the first time they are
+# asked for and shared by every consumer of the frame afterwards.
+class CameraFrame:
+    def __init__(self, bgr: np.ndarray, timestamp = 0):
+        self.bgr = bgr
+        self.timestamp = timestamp
+        self._rgb = None
+        self._resized = {}
+
+    @staticmethod
+    def from_response(image_response):
+        arr = np.frombuffer(image_response.image_data_uint8, dtype=np.uint8)
+        return CameraFrame(arr.reshape(image_response.height, image_response.width, 3), image_response.time_stamp)
+
+    @staticmethod
+    def from_rgb(rgb: np.ndarray):
+        frame = CameraFrame(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+        frame._rgb = rgb
+        return frame
+
+    @property
+    def rgb(self) -> np.ndarray:
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    # RGB scaled to width x height
+    def resized(self, width, height) -> np.ndarray:
+        if (width, height) not in self._resized:
+            self._resized[(width, height)] = cv2.resize(self.rgb, (width, height), interpolation=cv2.INTER_AREA)
+        return self._resized[(width, height)]
+
+    # resizes straight into a model input tensor, normalized for float models
+    def write_model_input(self, tensor: np.ndarray, input_mean=127.5, input_std=127.5):
+        height, width, _ = tensor.shape
+        if tensor.dtype == np.uint8:
+            cv2.resize(self.rgb, (width, height), dst=tensor, interpolation=cv2.INTER_AREA)
+        else:
+            np.subtract(self.resized(width, height), input_mean, out=tensor, casting='unsafe')
+            tensor /= input_std
+
+def get_frame(client: CarClient) -> CameraFrame:
     image_response = client.simGetImages([ImageRequest(0, ImageType.Scene, False, False)])[0]
-    arr = np.frombuffer(image_response.image_data_uint8, dtype=np.uint8)
-    image_bgr = arr.reshape(image_response.height, image_response.width, 3)
-    image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-    return image_rgb
-
-def set_input(interpreter, input_data, input_mean=127.5, input_std=127.5):
-    input_details = interpreter.get_input_details()[0]
-    if input_details['dtype'] == np.float32:
-        input_data = (np.float32(input_data) - input_mean) / input_std
-
-    tensor_index = input_details['index']
-    interpreter.set_tensor(tensor_index, input_data)
-
-def get_output(interpreter, index):
-    tensor_index = interpreter.get_output_details()[index]['index']
-    output_data = interpreter.get_tensor(tensor_index)
-    return np.squeeze(output_data)
-
-def detect_objects(interpreter, image, threshold):
-    set_input(interpreter, image)
-    interpreter.invoke()
-
-    boxes = get_output(interpreter, 0)
-    classes = get_output(interpreter, 1)
-    scores = get_output(interpreter, 2)
-    count = int(get_output(interpreter, 3))
-    results = []
-    for i in range(count):
-        # print(f"Detected a {class_names[int(classes[i])]} with confidence {scores[i]}")
-        if scores[i] >= threshold:
-            result = {
-                'bounding_box': boxes[i],
-                'class_id': int(classes[i]),
-                'score': scores[i]
-            }
-            results.append(result)
-
-
-    return results
+    return CameraFrame.from_response(image_response)
+
+def get_image(client: CarClient):
+    return get_frame(client).rgb
+
+DETECTION_DTYPE = np.dtype([
+    ('bounding_box', np.float32, 4),
+    ('class_id', np.int32),
+    ('score', np.float32),
+])
+
+# Wraps an SSD style detection model. The tensor indices are resolved once and the
+# input and outputs are accessed through interpreter.tensor() views, which are only
+# taken between invocations as the interpreter requires.
+# Detections come back as a DETECTION_DTYPE array, boxes are (ymin, xmin, ymax, xmax) in [0, 1].
+class ObjectDetector:
+    def __init__(self, interpreter, threshold, input_mean=127.5, input_std=127.5):
+        self.interpreter = interpreter
+        self.threshold = threshold
+        self._input_mean = input_mean
+        self._input_std = input_std
+        input_details = interpreter.get_input_details()[0]
+        _, self.height, self.width, _ = input_details['shape']
+        self._input = interpreter.tensor(input_details['index'])
+        boxes, classes, scores, count = interpreter.get_output_details()[:4]
+        self._outputs = [interpreter.tensor(details['index']) for details in (boxes, classes, scores, count)]
+
+    @staticmethod
+    def from_model(model_path, num_threads, threshold):
+        import tflite_runtime.interpreter as tflite
+        interpreter = tflite.Interpreter(model_path=model_path, num_threads=num_threads)
+        interpreter.allocate_tensors()
+        return ObjectDetector(interpreter, threshold)
+
+    # image is RGB, already at the model input size
+    def set_input(self, image: np.ndarray):
+        tensor = self._input()[0]
+        if tensor.dtype == np.uint8:
+            np.copyto(tensor, np.reshape(image, tensor.shape))
+        else:
+            np.subtract(np.reshape(image, tensor.shape), self._input_mean, out=tensor, casting='unsafe')
+            tensor /= self._input_std
+
+    def set_frame(self, frame: CameraFrame):
+        frame.write_model_input(self._input()[0], self._input_mean, self._input_std)
+
+    # runs the model on the current input
+    def detect(self) -> np.ndarray:
+        self.interpreter.invoke()
+        boxes, classes, scores, count = (output()[0] for output in self._outputs)
+        count = int(count)
+        keep = np.flatnonzero(scores[:count] >= self.threshold)
+        detections = np.empty(len(keep), dtype=DETECTION_DTYPE)
+        detections['bounding_box'] = boxes[keep]
+        detections['class_id'] = classes[keep]
+        detections['score'] = scores[keep]
+        return detections
+
+    def detect_frame(self, frame: CameraFrame) -> np.ndarray:
+        self.set_frame(frame)
+        return self.detect()
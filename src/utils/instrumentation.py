@@ -0,0 +1,134 @@
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from threading import Lock
+from typing import Dict, List
+import numpy as np
+
+# Histogram buckets are spaced BUCKETS_PER_DOUBLING to a doubling of the latency,
+# starting at MIN_LATENCY_NS, so every reported percentile is within about 9%
+MIN_LATENCY_NS = 1000
+BUCKETS_PER_DOUBLING = 8
+NUM_BUCKETS = BUCKETS_PER_DOUBLING * 28
+PERCENTILES = (50, 95, 99)
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = np.zeros(NUM_BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, latency_ns: int):
+        if latency_ns <= MIN_LATENCY_NS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log2(latency_ns / MIN_LATENCY_NS) * BUCKETS_PER_DOUBLING), NUM_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ns += latency_ns
+        self.max_ns = max(self.max_ns, latency_ns)
+
+    # upper bound of the bucket holding the percentile, in seconds
+    def percentile(self, percentile) -> float:
+        if self.count == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), self.count * percentile / 100))
+        upper_ns = MIN_LATENCY_NS * 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING)
+        return min(upper_ns, self.max_ns) / 1e9
+
+    def summary(self) -> Dict[str, float]:
+        summary = {"count": self.count, "mean": self.total_ns / max(self.count, 1) / 1e9}
+        for percentile in PERCENTILES:
+            summary[f"p{percentile}"] = self.percentile(percentile)
+        summary["max"] = self.max_ns / 1e9
+        return summary
+
+class _Stage:
+    __slots__ = ("_instrumentation", "_name", "_start")
+
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        self._instrumentation.record(self._name, time.perf_counter_ns() - self._start)
+
+# Per-stage latency histograms for the main loop.
+# Each stage of a tick is wrapped in `with instrumentation.stage(name):` and the
+# histograms are handed to the exporters every `interval` seconds from tick().
+# A disabled instance hands out a shared no-op context, so the calls can stay in the loop.
+class Instrumentation:
+    _NO_OP = nullcontext()
+
+    def __init__(self, enabled = True, exporters: List["LatencyExporter"] = None, interval = 10.0):
+        self.enabled = enabled
+        self.exporters = exporters if exporters is not None else []
+        self.interval = interval
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = Lock()
+        self._last_export = time.monotonic()
+
+    def stage(self, name):
+        if not self.enabled:
+            return Instrumentation._NO_OP
+        return _Stage(self, name)
+
+    def record(self, name, latency_ns: int):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(latency_ns)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    # exports once the interval has passed, call once per tick
+    def tick(self):
+        if not self.enabled or time.monotonic() - self._last_export < self.interval:
+            return
+        self.export()
+
+    def export(self):
+        self._last_export = time.monotonic()
+        summary = self.summary()
+        for exporter in self.exporters:
+            exporter.export(summary)
+
+class LatencyExporter(ABC):
+    @abstractmethod
+    def export(self, summary: Dict[str, Dict[str, float]]):
+        pass
+
+class StdoutExporter(LatencyExporter):
+    def export(self, summary):
+        print(f"{'stage':<16}{'count':>8}{'mean':>10}" + "".join(f"{'p%d' % p:>10}" for p in PERCENTILES) + f"{'max':>10}  (ms)")
+        for name, stats in summary.items():
+            timings = [stats["mean"]] + [stats[f"p{p}"] for p in PERCENTILES] + [stats["max"]]
+            print(f"{name:<16}{stats['count']:>8}" + "".join(f"{t * 1e3:>10.3f}" for t in timings))
+
+# appends one JSON line per export
+class FileExporter(LatencyExporter):
+    def __init__(self, path):
+        self._path = path
+
+    def export(self, summary):
+        with open(self._path, "a") as f:
+            f.write(json.dumps({"time": time.time(), "stages": summary}) + "\n")
+
+class MqttExporter(LatencyExporter):
+    def __init__(self, client, topic = "latency"):
+        self._client = client
+        self._topic = topic
+
+    def export(self, summary):
+        self._client.publish(self._topic, json.dumps(summary))
+
+disabled = Instrumentation(enabled=False)
@@ -3,19 +3,25 @@ import numpy as np
 
 DISTANCE_THRESHOLD = 3
 MIN_POINTS_IN_GROUP = 2
+def contiguousGroupRanges(point_cloud) -> np.ndarray:
+    # returns an (n, 2) array of [start, end) index ranges into point_cloud, one per group
+    num_points = len(point_cloud)
+    if num_points == 0:
+        return np.empty((0, 2), dtype=np.intp)
+
+    gaps = np.sqrt(np.sum(np.square(np.diff(point_cloud, axis=0)), axis=-1))
+    # negated so that NaN gaps split groups, like the point-by-point comparison did
+    splits = np.flatnonzero(~(gaps <= DISTANCE_THRESHOLD)) + 1
+
+    # the group still open at the end of the sweep is never emitted
+    starts = np.concatenate(([0], splits))[:-1]
+    ends = splits
+    keep = (ends - starts) >= MIN_POINTS_IN_GROUP
+    return np.stack((starts[keep], ends[keep]), axis=-1)
+
 def groupContiguousPoints(point_cloud):
-    groups = []
-    group = [point_cloud[0]]
-    for point in point_cloud[1:]:
-        dis = distance_of_point(point, group[-1])
-        # print(dis)
-        if dis <= DISTANCE_THRESHOLD:
-            group.append(point)
-        else:
-            if len(group) >= MIN_POINTS_IN_GROUP:
-                groups.append(group)
-            group = [point]
-    return groups
+    # groups are views into point_cloud, no points are copied
+    return [point_cloud[start:end] for start, end in contiguousGroupRanges(point_cloud)]
 
 
 def calculateCenterPoint(group):
@@ -41,6 +47,10 @@ def parse_lidar_data(data: LidarData) -> np.ndarray:
     # points = list(map(lambda p: {"point": p, "distance": distance_of_point(p)}, points))
     return points
 
+def azimuth_of_points(points: np.ndarray) -> np.ndarray:
+    # same angle convention as AngularOccupancy
+    return np.arctan2(points[..., 0], points[..., 1])
+
 def distance_of_point(to_point, from_point ):
     sum = np.sum(np.square( from_point - to_point ))
     return np.sqrt(sum)
@@ -0,0 +1,128 @@
+import math
+from typing import Dict, List
+import numpy as np
+import neat
+from neat import activations, aggregations
+
+def _elementwise(func):
+    # math functions applied per element, since the NumPy ones can differ in the last bit
+    ufunc = np.frompyfunc(func, 1, 1)
+    return lambda z: ufunc(z).astype(np.float64)
+
+_exp = _elementwise(math.exp)
+_tanh = _elementwise(math.tanh)
+
+# NumPy versions of the neat-python activations, giving bit-identical results
+_BATCH_ACTIVATIONS = {
+    activations.sigmoid_activation: lambda z: 1.0 / (1.0 + _exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    activations.tanh_activation: lambda z: _tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    activations.relu_activation: lambda z: np.where(z > 0.0, z, 0.0),
+    activations.identity_activation: lambda z: z,
+    activations.clamped_activation: lambda z: np.clip(z, -1.0, 1.0),
+    activations.abs_activation: np.abs,
+    activations.square_activation: lambda z: z ** 2,
+    activations.cube_activation: lambda z: z ** 3,
+}
+
+def _batch_activation(act_func):
+    if act_func in _BATCH_ACTIVATIONS:
+        return _BATCH_ACTIVATIONS[act_func]
+    # any other activation is applied element by element
+    return _elementwise(act_func)
+
+class _Layer:
+    def __init__(self, columns, activations, sum_links, other_nodes, bias, response):
+        # value columns written by this layer, in node order
+        self.columns = columns
+        self.activations = activations
+        # (sources, weights) padded to the widest fan-in, for sum aggregated nodes
+        self.sum_links = sum_links
+        # (position in layer, aggregation, source columns, weights) for any other aggregation
+        self.other_nodes = other_nodes
+        self.bias = bias
+        self.response = response
+
+# Evaluates a neat.nn.FeedForwardNetwork on a whole batch of inputs at once.
+# Nodes are grouped into layers that only depend on earlier layers, and each layer
+# is evaluated for every row of the batch with a few array operations.
+# Links are accumulated in the same order as FeedForwardNetwork.activate does.
+class BatchFeedForwardNetwork:
+    def __init__(self, num_inputs: int, num_columns: int, layers: List[_Layer], output_columns: np.ndarray):
+        self.num_inputs = num_inputs
+        self._num_columns = num_columns
+        self._layers = layers
+        self._output_columns = output_columns
+
+    @staticmethod
+    def create(net: neat.nn.FeedForwardNetwork):
+        column_of: Dict[int, int] = {node: i for i, node in enumerate(net.input_nodes)}
+        level_of: Dict[int, int] = {node: 0 for node in net.input_nodes}
+        levels: Dict[int, list] = {}
+        for node_eval in net.node_evals:
+            node, _, _, _, _, links = node_eval
+            level = 1 + max((level_of.get(i, 0) for i, _ in links), default=0)
+            level_of[node] = level
+            levels.setdefault(level, []).append(node_eval)
+
+        for level in sorted(levels):
+            for node_eval in levels[level]:
+                column_of[node_eval[0]] = len(column_of)
+        # the last column always holds 0.0, for padding and for nodes that are never evaluated
+        zero_column = len(column_of)
+
+        layers = []
+        for level in sorted(levels):
+            node_evals = levels[level]
+            sum_nodes = [i for i, node_eval in enumerate(node_evals) if node_eval[2] is aggregations.sum_aggregation]
+            fan_in = max((len(node_evals[i][5]) for i in sum_nodes), default=0)
+            sources = np.full((len(node_evals), fan_in), zero_column, dtype=np.intp)
+            weights = np.zeros((len(node_evals), fan_in), dtype=np.float64)
+            for i in sum_nodes:
+                for k, (source, weight) in enumerate(node_evals[i][5]):
+                    sources[i, k] = column_of.get(source, zero_column)
+                    weights[i, k] = weight
+
+            other_nodes = [
+                (i, node_eval[2], [column_of.get(source, zero_column) for source, _ in node_eval[5]], [weight for _, weight in node_eval[5]])
+                for i, node_eval in enumerate(node_evals) if node_eval[2] is not aggregations.sum_aggregation
+            ]
+
+            activation_groups: Dict[object, list] = {}
+            for i, node_eval in enumerate(node_evals):
+                activation_groups.setdefault(node_eval[1], []).append(i)
+
+            layers.append(_Layer(
+                columns=np.array([column_of[node_eval[0]] for node_eval in node_evals], dtype=np.intp),
+                activations=[(_batch_activation(act_func), np.array(nodes, dtype=np.intp)) for act_func, nodes in activation_groups.items()],
+                sum_links=(sources, weights),
+                other_nodes=other_nodes,
+                bias=np.array([node_eval[3] for node_eval in node_evals], dtype=np.float64),
+                response=np.array([node_eval[4] for node_eval in node_evals], dtype=np.float64),
+            ))
+
+        output_columns = np.array([column_of.get(node, zero_column) for node in net.output_nodes], dtype=np.intp)
+        return BatchFeedForwardNetwork(len(net.input_nodes), zero_column + 1, layers, output_columns)
+
+    # inputs is (n, num_inputs), returns (n, num_outputs)
+    def activate(self, inputs: np.ndarray) -> np.ndarray:
+        inputs = np.asarray(inputs, dtype=np.float64)
+        if inputs.ndim != 2 or inputs.shape[1] != self.num_inputs:
+            raise RuntimeError("Expected inputs of shape (n, {0:n}), got {1}".format(self.num_inputs, inputs.shape))
+
+        values = np.zeros((inputs.shape[0], self._num_columns), dtype=np.float64)
+        values[:, :self.num_inputs] = inputs
+        for layer in self._layers:
+            sources, weights = layer.sum_links
+            s = np.zeros((inputs.shape[0], len(layer.columns)), dtype=np.float64)
+            for k in range(sources.shape[1]):
+                s += values[:, sources[:, k]] * weights[:, k]
+            for i, agg_func, link_columns, link_weights in layer.other_nodes:
+                # evaluated row by row with the original aggregation function
+                s[:, i] = [agg_func([value * weight for value, weight in zip(row, link_weights)])
+                           for row in values[:, link_columns].tolist()]
+
+            z = layer.bias + layer.response * s
+            for act_func, nodes in layer.activations:
+                values[:, layer.columns[nodes]] = act_func(z[:, nodes])
+
+        return values[:, self._output_columns]
@@ -0,0 +1,118 @@
+import time
+from typing import Callable, Dict, List
+from utils.clock import Clock, wall_clock
+from utils.instrumentation import Instrumentation, disabled
+
+# a sheddable task runs anyway once this many of its periods in a row were shed
+MAX_SHED_PERIODS = 4
+
+class ScheduledTask:
+    def __init__(self, name, target: Callable[[], None], period_ns, sheddable, release_ns):
+        self.name = name
+        self.target = target
+        self.period_ns = period_ns
+        self.sheddable = sheddable
+        # the task is due once the clock reaches its release and should be done one period later
+        self.release_ns = release_ns
+        self.runs = 0
+        self.misses = 0
+        self.shed = 0
+        # periods shed since the last run
+        self.shed_streak = 0
+        # how long the next run is expected to take, halved for every period shed so a single
+        # slow run cannot keep the task shed forever
+        self.duration_ns = 0
+
+    # moves to the next release after now, returns how many releases were dropped on the
+    # way, which is also how many deadlines passed before now
+    def _advance(self, now) -> int:
+        self.release_ns += self.period_ns
+        skipped = 0
+        if self.release_ns < now:
+            skipped = (now - self.release_ns) // self.period_ns + 1
+            self.release_ns += skipped * self.period_ns
+        return skipped
+
+    # moves to the start of the period holding now, returns how many periods were skipped
+    def _catch_up(self, now) -> int:
+        periods = (now - self.release_ns) // self.period_ns
+        self.release_ns += periods * self.period_ns
+        return periods
+
+# Runs every task at its own rate from a single thread, in the order they were added,
+# so the collision path should be added first.
+# A task counts a deadline miss for every period that ended before it finished, so a
+# task that falls behind and skips releases counts each of them. A sheddable task waits
+# whenever running it for as long as it is expected to take would delay the next release of
+# a task that is not sheddable, so low-priority work gives way as soon as the loop overruns,
+# and counts as shed for every period that passes without a run. The expected duration is
+# the last one measured, halved for every period shed since. After max_shed_periods shed
+# periods in a row the task runs regardless, so a critical path that keeps overrunning
+# slows low-priority work down instead of stopping it.
+# Every run is timed as a stage of the instrumentation.
+class RateScheduler:
+    def __init__(self, clock: Clock = wall_clock, instrumentation: Instrumentation = disabled, max_shed_periods = MAX_SHED_PERIODS):
+        self._clock = clock
+        self._instrumentation = instrumentation
+        self._max_shed_periods = max_shed_periods
+        self._stopped = False
+        self.tasks: List[ScheduledTask] = []
+
+    # rate in Hz
+    def every(self, name, rate: float, target: Callable[[], None], sheddable = False) -> ScheduledTask:
+        task = ScheduledTask(name, target, round(1e9 / rate), sheddable, self._clock.time_ns())
+        self.tasks.append(task)
+        return task
+
+    def _next_critical_release(self):
+        releases = [task.release_ns for task in self.tasks if not task.sheddable]
+        return min(releases) if releases else None
+
+    # runs the tasks that are due and returns the ns until the next release.
+    # Sheddable tasks are also shed when they would run past deadline_ns, for loops that run
+    # their critical path outside the scheduler.
+    def run_pending(self, deadline_ns: int = None) -> int:
+        for task in self.tasks:
+            start = self._clock.time_ns()
+            if start < task.release_ns:
+                continue
+            if task.sheddable and task.shed_streak < self._max_shed_periods:
+                critical = self._next_critical_release()
+                if deadline_ns is not None and (critical is None or deadline_ns < critical):
+                    critical = deadline_ns
+                if critical is not None and start + task.duration_ns > critical:
+                    # retried once the critical path ran again, shed when its period passes first
+                    periods = task._catch_up(start)
+                    task.shed += periods
+                    task.shed_streak += periods
+                    task.duration_ns >>= min(periods, 63)
+                    continue
+            with self._instrumentation.stage(task.name):
+                task.target()
+            end = self._clock.time_ns()
+            task.runs += 1
+            task.shed_streak = 0
+            task.duration_ns = end - start
+            task.misses += task._advance(end)
+
+        now = self._clock.time_ns()
+        releases = [task.release_ns for task in self.tasks if task.release_ns > now]
+        critical = self._next_critical_release()
+        if critical is not None:
+            # sheddable tasks that had to wait are due again after it
+            releases.append(critical)
+        return min(releases) - now if releases else 0
+
+    # runs until stop() is called or a task raises
+    def run(self, sleep: Callable[[float], None] = time.sleep):
+        self._stopped = False
+        while not self._stopped:
+            wait_ns = self.run_pending()
+            if wait_ns > 0:
+                sleep(wait_ns / 1e9)
+
+    def stop(self):
+        self._stopped = True
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        return {task.name: {"runs": task.runs, "misses": task.misses, "shed": task.shed} for task in self.tasks}
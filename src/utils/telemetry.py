@@ -0,0 +1,133 @@
+import logging
+import struct
+from queue import Full, Queue
+from threading import Thread
+from typing import NamedTuple
+import numpy as np
+from utils.clock import Clock, wall_clock
+
+# One message per tick, little endian:
+#   header     sequence u32, kind u8, timestamp ns i64, updated count u32, removed count u32
+#   updated    OCCUPANT_RECORD_DTYPE records
+#   removed    u32 occupant ids
+# A keyframe carries every live occupant and no removals, a delta only the occupants that
+# are new or changed and the ids removed since the previous message. Sequence numbers
+# count every message built, so a gap means a consumer missed one and should discard
+# its state until the next keyframe.
+HEADER = struct.Struct("<IBqII")
+KEYFRAME = 0
+DELTA = 1
+OCCUPANT_RECORD_DTYPE = np.dtype([
+    ('id', '<u4'),
+    ('position', '<f4', (2,)),
+    ('classification', '<i4'),
+])
+
+# a moved occupant is sent again once it is this far from the position last sent
+POSITION_TOLERANCE = 0.1
+KEYFRAME_INTERVAL = 50
+QUEUE_SIZE = 8
+
+class OccupantMessage(NamedTuple):
+    sequence: int
+    kind: int
+    timestamp_ns: int
+    updated: np.ndarray
+    removed: np.ndarray
+
+def encode_occupants(sequence, kind, timestamp_ns, updated: np.ndarray, removed: np.ndarray) -> bytes:
+    return b"".join((
+        HEADER.pack(sequence, kind, timestamp_ns, len(updated), len(removed)),
+        updated.astype(OCCUPANT_RECORD_DTYPE, copy=False).tobytes(),
+        removed.astype('<u4', copy=False).tobytes(),
+    ))
+
+def decode_occupants(payload: bytes) -> OccupantMessage:
+    sequence, kind, timestamp_ns, num_updated, num_removed = HEADER.unpack_from(payload)
+    updated = np.frombuffer(payload, dtype=OCCUPANT_RECORD_DTYPE, count=num_updated, offset=HEADER.size)
+    removed = np.frombuffer(payload, dtype='<u4', count=num_removed, offset=HEADER.size + updated.nbytes)
+    return OccupantMessage(sequence, kind, timestamp_ns, updated, removed)
+
+# Publishes the occupant table as one binary message per tick (see HEADER), sending only
+# what changed since the last message and a full keyframe every KEYFRAME_INTERVAL messages.
+# Ticks closer together than 1 / max_rate are skipped, their changes go out with the next
+# message. Messages are handed to a sender thread through a bounded queue, so a slow broker
+# never blocks the loop: when the queue is full the message is dropped and the next one is
+# a keyframe.
+class TelemetryPublisher:
+    def __init__(self, client, topic = "objects", max_rate: float = None, keyframe_interval = KEYFRAME_INTERVAL, clock: Clock = wall_clock):
+        self._client = client
+        self._topic = topic
+        self._min_interval_ns = round(1e9 / max_rate) if max_rate else 0
+        self._keyframe_interval = keyframe_interval
+        self._clock = clock
+        self._sequence = 0
+        self._last_publish_ns = None
+        self._needs_keyframe = True
+        # last sent record and liveness per occupant id
+        self._sent = np.zeros(0, dtype=OCCUPANT_RECORD_DTYPE)
+        self._sent_live = np.zeros(0, dtype=bool)
+        self._queue = Queue(maxsize=QUEUE_SIZE)
+        self._sender = Thread(target=self._send, name="telemetry", daemon=True)
+        self._sender.start()
+
+    def _send(self):
+        while True:
+            payload = self._queue.get()
+            if payload is None:
+                return
+            try:
+                self._client.publish(self._topic, payload)
+            except Exception:
+                logging.exception("failed to publish telemetry")
+
+    def _grow(self, size):
+        sent = np.zeros(size, dtype=OCCUPANT_RECORD_DTYPE)
+        sent[:len(self._sent)] = self._sent
+        sent['id'] = np.arange(size)
+        sent_live = np.zeros(size, dtype=bool)
+        sent_live[:len(self._sent_live)] = self._sent_live
+        self._sent, self._sent_live = sent, sent_live
+
+    # ids, center points and classifications of the live occupants; returns False when rate limited
+    def publish(self, ids: np.ndarray, center_points: np.ndarray, classifications: np.ndarray) -> bool:
+        now = self._clock.time_ns()
+        if self._last_publish_ns is not None and now - self._last_publish_ns < self._min_interval_ns:
+            return False
+        self._last_publish_ns = now
+
+        ids = np.asarray(ids)
+        size = int(ids.max()) + 1 if len(ids) else 0
+        if size > len(self._sent):
+            self._grow(max(size, 2 * len(self._sent)))
+        live = np.zeros(len(self._sent), dtype=bool)
+        live[ids] = True
+
+        keyframe = self._needs_keyframe or self._sequence % self._keyframe_interval == 0
+        if keyframe:
+            changed = np.ones(len(ids), dtype=bool)
+            removed = np.zeros(0, dtype=np.uint32)
+        else:
+            sent = self._sent[ids]
+            changed = (~self._sent_live[ids]
+                       | (sent['classification'] != classifications)
+                       | np.any(np.abs(sent['position'] - center_points) > POSITION_TOLERANCE, axis=1))
+            removed = np.flatnonzero(self._sent_live & ~live)
+
+        updated_ids = ids[changed]
+        self._sent['position'][updated_ids] = np.asarray(center_points)[changed]
+        self._sent['classification'][updated_ids] = np.asarray(classifications)[changed]
+        self._sent_live = live
+        payload = encode_occupants(self._sequence, KEYFRAME if keyframe else DELTA, now, self._sent[updated_ids], removed)
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        try:
+            self._queue.put_nowait(payload)
+            self._needs_keyframe = False
+        except Full:
+            self._needs_keyframe = True
+        return True
+
+    # sends the queued messages and stops the sender
+    def close(self):
+        self._queue.put(None)
+        self._sender.join()
@@ -0,0 +1,71 @@
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute() / "src"))
+from utils.clock import SimulatedClock
+from utils.scheduler import MAX_SHED_PERIODS, RateScheduler
+
+# runs the scheduler for duration simulated seconds, sleeping by advancing the clock
+def run_for(scheduler, clock, duration):
+    end = clock.time_ns() + round(duration * 1e9)
+    while clock.time_ns() < end:
+        wait_ns = scheduler.run_pending()
+        if wait_ns > 0:
+            clock.advance(wait_ns / 1e9)
+
+# a target that takes the given durations on the simulated clock, then the last one every run
+def taking(clock, *durations):
+    runs = []
+
+    def target():
+        clock.advance(durations[min(len(runs), len(durations) - 1)])
+        runs.append(clock.time_ns())
+    return target
+
+def test_runs_every_period():
+    clock = SimulatedClock(0)
+    scheduler = RateScheduler(clock)
+    scheduler.every("control", 50, taking(clock, 0.001))
+    scheduler.every("vision", 10, taking(clock, 0.005), sheddable=True)
+    run_for(scheduler, clock, 10)
+    summary = scheduler.summary()
+    assert summary["control"] == {"runs": 500, "misses": 0, "shed": 0}
+    assert summary["vision"] == {"runs": 100, "misses": 0, "shed": 0}
+
+def test_sheds_task_that_would_delay_the_critical_path():
+    clock = SimulatedClock(0)
+    scheduler = RateScheduler(clock)
+    scheduler.every("control", 50, taking(clock, 0.001))
+    scheduler.every("vision", 10, taking(clock, 0.005, 0.030, 0.005), sheddable=True)
+    run_for(scheduler, clock, 1)
+    summary = scheduler.summary()
+    # after the slow second run the next period is shed, then the task runs again
+    assert summary["vision"] == {"runs": 9, "misses": 0, "shed": 1}
+    assert summary["control"]["misses"] == 0
+
+def test_slow_run_does_not_shed_forever():
+    clock = SimulatedClock(0)
+    scheduler = RateScheduler(clock)
+    scheduler.every("control", 50, taking(clock, 0.001))
+    scheduler.every("vision", 10, taking(clock, 0.030, 0.005), sheddable=True)
+    run_for(scheduler, clock, 100)
+    summary = scheduler.summary()
+    assert summary["vision"]["shed"] <= 1
+    assert summary["vision"]["runs"] + summary["vision"]["shed"] >= 999
+    assert summary["control"]["misses"] <= 1
+
+# like Main.main, the critical path runs outside the scheduler and passes its deadline
+def test_overrunning_critical_path_does_not_starve_sheddable_tasks():
+    clock = SimulatedClock(0)
+    scheduler = RateScheduler(clock)
+    scheduler.every("categorize", 10, taking(clock, 0.002), sheddable=True)
+    scheduler.every("sendobj", 5, taking(clock, 0), sheddable=True)
+    for _ in range(500):
+        deadline = clock.time_ns() + round(1e9 / 50)
+        clock.advance(0.022)
+        scheduler.run_pending(deadline)
+    summary = scheduler.summary()
+    for name in ("categorize", "sendobj"):
+        runs, shed = summary[name]["runs"], summary[name]["shed"]
+        assert runs > 0
+        assert shed <= MAX_SHED_PERIODS * runs